@@ -0,0 +1,7 @@
+# Performance benchmarks for extract_prompts.py.
+#
+#   python -m benchmarks.run --images 500 --nodes 300 --json results.json
+#   python -m benchmarks.workflow_graph --nodes 1000
+#
+# corpus.py generates reproducible synthetic ComfyUI/A1111 PNGs; run.py times
+# each stage of the extractor against such a corpus and reports JSON.
@@ -0,0 +1,151 @@
+# corpus.py
+#
+# Reproducible synthetic corpus of ComfyUI / A1111 PNGs for benchmarking.
+# Images are 1x1 and written without Pillow; only the metadata chunks are
+# realistic. The same arguments and seed always produce byte-identical files.
+
+import json
+import os
+import random
+import struct
+import sys
+import zlib
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from extract_prompts import PNG_SIGNATURE  # noqa: E402
+
+# Chunk profiles and how often each appears; an image gets every chunk named
+# in its profile.
+DEFAULT_MIX = {"workflow+prompt": 0.8, "prompt": 0.1, "parameters": 0.1}
+
+_WORDS = (
+    "candid photograph of an elderly woman in a sunlit coffee shop, futuristic city "
+    "skyline at dusk with neon reflections on glass towers, misty forest at dawn, "
+    "cinematic lighting, shallow depth of field, 35mm film grain, highly detailed, "
+    "volumetric fog, golden hour, portrait, wide angle, dramatic clouds, reflections"
+).replace(",", "").split()
+
+
+def parse_mix(text):
+    """'workflow+prompt=0.8,parameters=0.2' -> {'workflow+prompt': 0.8, 'parameters': 0.2}"""
+    mix = {}
+    for part in text.split(","):
+        profile, _, weight = part.partition("=")
+        mix[profile.strip()] = float(weight) if weight else 1.0
+    return mix
+
+
+def random_prompt(rng, words=40):
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def make_graphs(prompt, seed, nodes=50, chain_depth=0):
+    """
+    Return (workflow, api_prompt) for one txt2img pipeline padded to roughly
+    `nodes` nodes: half LoraLoader nodes on the model path, half ImageScaleBy
+    nodes between VAEDecode and SaveImage. chain_depth > 0 routes the prompt
+    through that many STRING passthrough nodes before the CLIPTextEncode.
+    """
+    wf_nodes = []
+    links = []
+    api = {}
+
+    def add(type_, inputs, widgets=None, api_inputs=None):
+        node_id = len(wf_nodes) + 1
+        wf_inputs = []
+        for name, ltype, src in inputs:
+            link_id = None
+            if src is not None:
+                link_id = len(links) + 1
+                links.append([link_id, src, 0, node_id, len(wf_inputs), ltype])
+            wf_inputs.append({"name": name, "type": ltype, "link": link_id})
+        wf_nodes.append({"id": node_id, "type": type_, "order": node_id - 1,
+                         "inputs": wf_inputs, "widgets_values": widgets or []})
+        api_in = {name: [str(src), 0] for name, _, src in inputs if src is not None}
+        api_in.update(api_inputs or {})
+        api[str(node_id)] = {"class_type": type_, "inputs": api_in}
+        return node_id
+
+    fillers = max(0, nodes - 6 - chain_depth - (1 if chain_depth else 0))
+    model = add("CheckpointLoaderSimple", [], ["model.safetensors"],
+                {"ckpt_name": "model.safetensors"})
+    for _ in range(fillers // 2):
+        model = add("LoraLoader", [("model", "MODEL", model)], ["lora.safetensors", 0.8],
+                    {"lora_name": "lora.safetensors", "strength_model": 0.8})
+
+    if chain_depth:
+        text = add("PrimitiveStringMultiline", [], [prompt], {"value": prompt})
+        for _ in range(chain_depth):
+            text = add("StringPassthrough", [("text", "STRING", text)])
+        positive = add("CLIPTextEncode", [("clip", "CLIP", 1), ("text", "STRING", text)])
+    else:
+        positive = add("CLIPTextEncode", [("clip", "CLIP", 1)], [prompt], {"text": prompt})
+    negative = add("CLIPTextEncode", [("clip", "CLIP", 1)], ["blurry, lowres"],
+                   {"text": "blurry, lowres"})
+    sampler = add("KSampler", [("model", "MODEL", model), ("positive", "CONDITIONING", positive),
+                               ("negative", "CONDITIONING", negative)],
+                  [seed, "fixed", 20, 7.0], {"seed": seed, "steps": 20, "cfg": 7.0})
+    image = add("VAEDecode", [("samples", "LATENT", sampler), ("vae", "VAE", 1)])
+    for _ in range(fillers - fillers // 2):
+        image = add("ImageScaleBy", [("image", "IMAGE", image)], ["lanczos", 1.0],
+                    {"upscale_method": "lanczos", "scale_by": 1.0})
+    add("SaveImage", [("images", "IMAGE", image)], ["ComfyUI"], {"filename_prefix": "ComfyUI"})
+    return {"nodes": wf_nodes, "links": links}, api
+
+
+def make_parameters(prompt, seed):
+    return (f"{prompt}\nNegative prompt: blurry, lowres\n"
+            f"Steps: 20, Sampler: Euler a, CFG scale: 7, Seed: {seed}")
+
+
+def _chunk(ctype, data):
+    return (struct.pack(">I", len(data)) + ctype + data
+            + struct.pack(">I", zlib.crc32(ctype + data) & 0xFFFFFFFF))
+
+
+def write_png(path, chunks, compress=False):
+    """Write a 1x1 RGB PNG carrying the given {keyword: text} chunks (zTXt if compress)."""
+    parts = [PNG_SIGNATURE, _chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))]
+    for key, text in chunks.items():
+        body = text.encode("latin-1")
+        if compress:
+            parts.append(_chunk(b"zTXt", key.encode("latin-1") + b"\0\0" + zlib.compress(body)))
+        else:
+            parts.append(_chunk(b"tEXt", key.encode("latin-1") + b"\0" + body))
+    parts.append(_chunk(b"IDAT", zlib.compress(b"\0\0\0\0")))
+    parts.append(_chunk(b"IEND", b""))
+    with open(path, "wb") as f:
+        f.write(b"".join(parts))
+
+
+def generate_corpus(out_dir, images=100, nodes=50, chain_depth=0, mix=None,
+                    compress=False, batch_size=1, seed=0):
+    """
+    Write `images` PNGs into out_dir and return the config as a dict.
+    Consecutive groups of batch_size images share identical metadata, like the
+    images of one ComfyUI batch.
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    profiles = list(mix)
+    weights = [mix[p] for p in profiles]
+    os.makedirs(out_dir, exist_ok=True)
+    chunks = {}
+    for i in range(images):
+        if i % batch_size == 0:
+            prompt = random_prompt(rng)
+            image_seed = rng.randrange(2 ** 32)
+            profile = rng.choices(profiles, weights)[0].split("+")
+            workflow, api = make_graphs(prompt, image_seed, nodes, chain_depth)
+            chunks = {}
+            if "workflow" in profile:
+                chunks["workflow"] = json.dumps(workflow)
+            if "prompt" in profile:
+                chunks["prompt"] = json.dumps(api)
+            if "parameters" in profile:
+                chunks["parameters"] = make_parameters(prompt, image_seed)
+        write_png(os.path.join(out_dir, f"img_{i:06d}.png"), chunks, compress)
+    return {"images": images, "nodes": nodes, "chain_depth": chain_depth, "mix": mix,
+            "compress": compress, "batch_size": batch_size, "seed": seed}
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# run.py
+#
+# Time each stage of extract_prompts.py against a synthetic corpus and emit
+# the results as JSON, so runs can be compared across releases.
+#
+# Usage:
+#   python -m benchmarks.run
+#   python -m benchmarks.run --images 2000 --nodes 300 --compress --json results.json
+#   python -m benchmarks.run --corpus D:\bench\corpus      (reuse / keep the corpus)
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import extract_prompts  # noqa: E402
+from benchmarks.corpus import DEFAULT_MIX, generate_corpus, parse_mix  # noqa: E402
+
+
+def _timed(items, fn):
+    """Call fn(item) for each item; return (seconds, results)."""
+    start = time.perf_counter()
+    results = [fn(item) for item in items]
+    return time.perf_counter() - start, results
+
+
+def _stage(seconds, count):
+    return {
+        "seconds": round(seconds, 6),
+        "items": count,
+        "per_item_us": round(seconds / count * 1e6, 3) if count else None,
+    }
+
+
+def _ok_count(results):
+    return sum(1 for prompt, _ in results if prompt)
+
+
+def run_stages(corpus_dir, out_dir):
+    """Time every stage over the corpus; return {stage: {...}}."""
+    stages = {}
+
+    seconds, files = _timed([None], lambda _: list(
+        extract_prompts.scan_png_files(corpus_dir, recursive=True)))
+    files = files[0]
+    stages["walk"] = _stage(seconds, len(files))
+
+    seconds, metas = _timed(files, lambda f: extract_prompts.read_png_text_chunks(f.path))
+    stages["chunk_read"] = _stage(seconds, len(files))
+    stages["chunk_read"]["bytes"] = sum(f.size for f in files)
+
+    # Chunks are only located by chunk_read; decoding (and inflating zTXt)
+    # happens on first access.
+    for key in ("workflow", "prompt", "parameters"):
+        present = [m for m in metas if key in m]
+        seconds, _ = _timed(present, lambda m: m[key])
+        stages[f"chunk_decode_{key}"] = _stage(seconds, len(present))
+
+    for key, extract in (("workflow", extract_prompts.extract_from_workflow),
+                         ("prompt", extract_prompts.extract_from_api_prompt)):
+        raws = [m[key] for m in metas if key in m]
+        # Parsed graphs are dropped as they go: keeping thousands alive makes
+        # the garbage collector, not the parser, dominate the timing.
+        seconds, _ = _timed(raws, lambda r: json.loads(r) and None)
+        stages[f"json_parse_{key}"] = _stage(seconds, len(raws))
+        stages[f"json_parse_{key}"]["bytes"] = sum(len(r) for r in raws)
+        # Other backends, fed what the extractor feeds them (UTF-8 bytes when
+        # the chunk needs no transcoding).
+        for name, backend in extract_prompts.JSON_BACKENDS.items():
+            if name == "json":
+                continue
+            present = [m for m in metas if key in m]
+            inputs = [(backend.takes_bytes and m.utf8(key)) or m[key] for m in present]
+            seconds, _ = _timed(inputs, lambda r: backend.loads(r) and None)
+            stage = stages[f"json_parse_{key}_{name}"] = _stage(seconds, len(inputs))
+            if seconds:
+                stage["speedup"] = round(stages[f"json_parse_{key}"]["seconds"] / seconds, 2)
+        graphs = [json.loads(r) for r in raws]
+        seconds, results = _timed(graphs, extract)
+        stages[f"extract_{key}"] = _stage(seconds, len(graphs))
+        stages[f"extract_{key}"]["succeeded"] = _ok_count(results)
+
+    raws = [m["parameters"] for m in metas if "parameters" in m]
+    seconds, results = _timed(raws, extract_prompts.extract_from_parameters)
+    stages["extract_parameters"] = _stage(seconds, len(raws))
+    stages["extract_parameters"]["succeeded"] = _ok_count(results)
+
+    seconds, results = _timed(
+        files, lambda f: extract_prompts.extract_final_positive_prompt_from_png(f.path))
+    stages["end_to_end"] = _stage(seconds, len(files))
+    stages["end_to_end"]["succeeded"] = _ok_count(results)
+
+    if extract_prompts.get_json_backend().name != "json":
+        stdlib = extract_prompts.get_json_backend("json")
+        seconds, _ = _timed(files, lambda f: extract_prompts.extract_final_positive_prompt_from_png(
+            f.path, json_backend=stdlib))
+        stages["end_to_end_json"] = _stage(seconds, len(files))
+
+    # Same, with the per-run chunk memo and topology plan cache the CLI uses.
+    memo = extract_prompts.ResultMemo()
+    plans = extract_prompts.TopologyPlanCache()
+    seconds, cached_results = _timed(
+        files, lambda f: extract_prompts.extract_final_positive_prompt_from_png(
+            f.path, memo=memo, plan_cache=plans))
+    stages["end_to_end_cached"] = _stage(seconds, len(files))
+    stages["end_to_end_cached"].update(succeeded=_ok_count(cached_results),
+                                       memo_hits=memo.hits, plan_hits=plans.hits)
+
+    # Whole-run iterators: workers reading their own files vs the staged
+    # pipeline (reader threads hand chunks to the extractor), and the staged
+    # pipeline feeding worker processes by pickle vs through shared memory.
+    for stage, options in (("iter_extracted", {}),
+                           ("iter_extracted_staged", {"read_threads": 4}),
+                           ("iter_extracted_staged_jobs2", {"read_threads": 4, "jobs": 2}),
+                           ("iter_extracted_staged_jobs2_shm",
+                            {"read_threads": 4, "jobs": 2, "shared_memory": True})):
+        seconds, _ = _timed([None], lambda _: list(extract_prompts.iter_extracted(
+            files, **options)))
+        stages[stage] = _stage(seconds, len(files))
+
+    # Worker pool dispatch: one file per task vs adaptive batches. The
+    # difference per file is the IPC overhead that batching saves.
+    for stage, batch_size in (("iter_extracted_jobs2_per_file", 1),
+                              ("iter_extracted_jobs2_batched", None)):
+        stats = extract_prompts.ExtractionStats()
+        seconds, _ = _timed([None], lambda _: list(extract_prompts.iter_extracted(
+            files, jobs=2, stats=stats, batch_size=batch_size)))
+        stages[stage] = _stage(seconds, len(files))
+        stages[stage]["batches"] = stats.counts.get("batches", 0)
+    per_file, batched = (stages[f"iter_extracted_jobs2_{s}"]["seconds"]
+                         for s in ("per_file", "batched"))
+    stages["iter_extracted_jobs2_batched"]["saved_per_item_us"] = (
+        round((per_file - batched) / len(files) * 1e6, 3) if files else None)
+
+    # Thread vs process workers. Threads only run extraction in parallel on
+    # a free-threaded (no-GIL) build; see "gil_enabled" in the report.
+    for executor in extract_prompts.EXECUTORS:
+        seconds, _ = _timed([None], lambda _: list(extract_prompts.iter_extracted(
+            files, jobs=2, executor=executor)))
+        stages[f"iter_extracted_jobs2_{executor}"] = _stage(seconds, len(files))
+
+    rows = [(f.name, prompt) for f, (prompt, _) in zip(files, results) if prompt]
+    for ext, writer in (("txt", extract_prompts.write_txt), ("csv", extract_prompts.write_csv)):
+        seconds, _ = _timed([None], lambda _: writer(os.path.join(out_dir, f"prompts.{ext}"), rows))
+        stages[f"write_{ext}"] = _stage(seconds, len(rows))
+    return stages
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark extract_prompts.py stages on a synthetic ComfyUI corpus.")
+    parser.add_argument("--images", type=int, default=500)
+    parser.add_argument("--nodes", type=int, default=50,
+                        help="Approximate node count of each workflow")
+    parser.add_argument("--chain-depth", type=int, default=0,
+                        help="STRING passthrough nodes between the prompt and its CLIPTextEncode")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="Chunk profiles and weights, e.g. 'workflow+prompt=0.8,parameters=0.2'")
+    parser.add_argument("--compress", action="store_true", help="Store chunks as zTXt")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Consecutive images sharing identical metadata")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus", default=None,
+                        help="Corpus folder; generated if empty or missing (default: temp folder)")
+    parser.add_argument("--json", dest="json_path", default=None,
+                        help="Write results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus or os.path.join(tmp, "corpus")
+        config = {"images": args.images, "nodes": args.nodes, "chain_depth": args.chain_depth,
+                  "mix": args.mix, "compress": args.compress, "batch_size": args.batch_size,
+                  "seed": args.seed}
+        if not (os.path.isdir(corpus_dir) and os.listdir(corpus_dir)):
+            config = generate_corpus(corpus_dir, **config)
+        else:
+            config = {"reused": corpus_dir}
+        stages = run_stages(corpus_dir, tmp)
+
+    report = {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "gil_enabled": getattr(sys, "_is_gil_enabled", lambda: True)(),
+        "json_backend": extract_prompts.get_json_backend().name,
+        "corpus": config,
+        "stages": stages,
+    }
+    text = json.dumps(report, indent=2)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# workflow_graph.py
+#
+# Compare workflow traversal with the WorkflowGraph index against the old
+# behaviour of scanning workflow["nodes"] on every hop.
+#
+# Usage:
+#   python -m benchmarks.workflow_graph
+#   python -m benchmarks.workflow_graph --nodes 2000 --repeat 5
+
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import extract_prompts  # noqa: E402
+
+
+def make_chain_workflow(n_nodes):
+    """
+    CLIPTextEncode -> KSampler -> VAEDecode -> (n_nodes - 4) image passthrough
+    nodes -> SaveImage. Nodes are listed save-first so a linear id scan has to
+    walk most of the list for every upstream hop.
+    """
+    nodes = [
+        {"id": 1, "type": "CLIPTextEncode", "order": 0,
+         "inputs": [{"name": "clip", "type": "CLIP", "link": None}],
+         "widgets_values": ["a synthetic prompt"]},
+        {"id": 2, "type": "KSampler", "order": 1,
+         "inputs": [{"name": "positive", "type": "CONDITIONING", "link": 1}]},
+        {"id": 3, "type": "VAEDecode", "order": 2,
+         "inputs": [{"name": "samples", "type": "LATENT", "link": 2}]},
+    ]
+    links = [[1, 1, 0, 2, 0, "CONDITIONING"], [2, 2, 0, 3, 0, "LATENT"]]
+    prev = 3
+    for node_id in range(4, n_nodes):
+        link_id = len(links) + 1
+        links.append([link_id, prev, 0, node_id, 0, "IMAGE"])
+        nodes.append({"id": node_id, "type": "ImageScaleBy", "order": node_id - 1,
+                      "inputs": [{"name": "image", "type": "IMAGE", "link": link_id}]})
+        prev = node_id
+    link_id = len(links) + 1
+    links.append([link_id, prev, 0, n_nodes, 0, "IMAGE"])
+    nodes.append({"id": n_nodes, "type": "SaveImage", "order": n_nodes,
+                  "inputs": [{"name": "images", "type": "IMAGE", "link": link_id}]})
+    return {"nodes": list(reversed(nodes)), "links": links}
+
+
+class LinearScanGraph(extract_prompts.WorkflowGraph):
+    """Node lookups by scanning workflow["nodes"], like get_node_by_id did per hop."""
+
+    def node(self, node_id):
+        return extract_prompts.get_node_by_id(self.workflow, node_id)
+
+
+def _time(workflow, repeat):
+    return min(timeit.repeat(lambda: extract_prompts.extract_from_workflow(workflow),
+                             number=1, repeat=repeat))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time workflow traversal with and without the WorkflowGraph index.")
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    workflow = make_chain_workflow(args.nodes)
+    prompt, err = extract_prompts.extract_from_workflow(workflow)
+    assert prompt == "a synthetic prompt", err
+
+    indexed = _time(workflow, args.repeat)
+    original = extract_prompts.WorkflowGraph
+    extract_prompts.WorkflowGraph = LinearScanGraph
+    try:
+        scanning = _time(workflow, args.repeat)
+    finally:
+        extract_prompts.WorkflowGraph = original
+
+    print(f"{args.nodes}-node workflow")
+    print(f"  linear scan per hop: {scanning * 1000:9.2f} ms")
+    print(f"  WorkflowGraph index: {indexed * 1000:9.2f} ms")
+    print(f"  speedup:             {scanning / indexed:9.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,8 +21,7 @@ if not exist "%TARGET%\" (
 set "SCRIPT_DIR=%~dp0"
 
 echo Scanning "%TARGET%" ...
-python "%SCRIPT_DIR%extract_prompts.py" "%TARGET%" "%TARGET%\prompts.txt"
-python "%SCRIPT_DIR%extract_prompts.py" "%TARGET%" "%TARGET%\prompts.csv" --csv
+python "%SCRIPT_DIR%extract_prompts.py" "%TARGET%" --out "%TARGET%\prompts.txt" --out "%TARGET%\prompts.csv"
 
 echo.
 echo Done. prompts.txt and prompts.csv written to "%TARGET%"
@@ -9,28 +9,93 @@
 #   python extract_prompts.py "C:\path\to\images"
 #   python extract_prompts.py "C:\path\to\images" "C:\out\my_prompts.csv" --csv
 #   python extract_prompts.py "C:\path\to\images" --recursive
+#   python extract_prompts.py "C:\path\to\images" --jobs 8
+#   python extract_prompts.py "C:\path\to\images" --out prompts.txt --out prompts.csv
 
 import argparse
 import csv
+import hashlib
 import json
 import os
+import re
+import sqlite3
+import struct
 import sys
-from collections import deque
-
-from PIL import Image
-
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque, namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache, partial
+from multiprocessing.shared_memory import SharedMemory
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: only used for files the chunk reader rejects
+    Image = None
+
+try:
+    import orjson
+except ImportError:  # optional: a faster parser for the workflow/prompt chunks
+    orjson = None
+
+# A node whose type contains one of these is a save node. Extend with
+# register_save_node_type() (or --save-node-type) for custom nodes.
 SAVE_NODE_MARKERS = ("SaveImage", "Save Image", "Image Save")
 # Used only when no save node exists (e.g. a preview-only workflow was embedded).
 FALLBACK_NODE_MARKERS = ("PreviewImage",)
 
+_save_pattern = _fallback_pattern = None
+
+
+def _compile_node_markers():
+    # One pattern per rank: in a single alternation a fallback match could
+    # consume the letters of an overlapping save marker ("PreviewImage Save").
+    global _save_pattern, _fallback_pattern
+    _save_pattern = re.compile("|".join(map(re.escape, SAVE_NODE_MARKERS)))
+    _fallback_pattern = (re.compile("|".join(map(re.escape, FALLBACK_NODE_MARKERS)))
+                         if FALLBACK_NODE_MARKERS else None)
+    _node_type_rank.cache_clear()
+    _compile_prefilter()
+
+
+def register_save_node_type(marker, fallback=False):
+    """
+    Treat node types containing `marker` as save nodes, or with fallback=True
+    as preview nodes used only when a graph has no save node. Register before
+    extracting: memoised results and traversal plans are not invalidated.
+    """
+    global SAVE_NODE_MARKERS, FALLBACK_NODE_MARKERS
+    if not marker or marker in SAVE_NODE_MARKERS + FALLBACK_NODE_MARKERS:
+        return
+    if fallback:
+        FALLBACK_NODE_MARKERS += (marker,)
+    else:
+        SAVE_NODE_MARKERS += (marker,)
+    _compile_node_markers()
+
+
+@lru_cache(maxsize=4096)
+def _node_type_rank(node_type):
+    """0 for a save node type, 1 for a fallback type, None for anything else."""
+    if _save_pattern.search(node_type):
+        return 0
+    if _fallback_pattern is not None and _fallback_pattern.search(node_type):
+        return 1
+    return None
+
 
 def _matching_nodes(candidates, get_type):
-    for markers in (SAVE_NODE_MARKERS, FALLBACK_NODE_MARKERS):
-        found = [c for c in candidates
-                 if any(marker in get_type(c) for marker in markers)]
-        if found:
-            return found
-    return []
+    # Ranked per candidate by the cached _node_type_rank; callers pass distinct types
+    # where they can, so the work scales with types rather than nodes.
+    found = ([], [])
+    for c in candidates:
+        rank = _node_type_rank(get_type(c))
+        if rank is not None:
+            found[rank].append(c)
+    return found[0] or found[1]
 
 
 # ---------------------------------------------------------------------------
@@ -53,12 +118,67 @@ def get_node_by_id(workflow, node_id):
     return None
 
 
-def find_highest_order_saveimage(workflow):
-    nodes = workflow.get("nodes", [])
-    cands = _matching_nodes(nodes, lambda n: n.get("type", ""))
+class WorkflowGraph:
+    """
+    Lookup tables over a workflow dict: node id -> node, link id -> link record,
+    node type -> nodes, and each node's linked inputs paired with their source
+    node id. Built once per workflow and passed to every traversal stage, so a
+    hop costs O(1) instead of a scan of workflow["nodes"].
+    """
+
+    def __init__(self, workflow):
+        self.workflow = workflow
+        self.link_map = build_link_map(workflow)
+        self.nodes = {}
+        self.positions = {}  # node id -> index in workflow["nodes"]
+        for pos, n in enumerate(workflow.get("nodes", [])):
+            # get_node_by_id returns the first match; keep that behaviour
+            if n.get("id") not in self.nodes:
+                self.nodes[n.get("id")] = n
+                self.positions[n.get("id")] = pos
+        # Filled on first use: a walk usually touches a fraction of the nodes.
+        self._input_links = {}
+        self._nodes_by_type = None
+
+    @property
+    def nodes_by_type(self):
+        """type -> [(position in workflow["nodes"], node)]"""
+        if self._nodes_by_type is None:
+            by_type = {}
+            for pos, n in enumerate(self.workflow.get("nodes", [])):
+                by_type.setdefault(n.get("type", ""), []).append((pos, n))
+            self._nodes_by_type = by_type
+        return self._nodes_by_type
+
+    def _linked_inputs(self, node):
+        return [(inp, _link_source(self.link_map, inp["link"]))
+                for inp in node.get("inputs", [])
+                if inp.get("link") is not None]
+
+    def node(self, node_id):
+        if node_id is None:
+            return None
+        return self.nodes.get(node_id)
+
+    def input_links(self, node):
+        """[(input, source_node_id)] for the node's linked inputs, in input order."""
+        node_id = node.get("id")
+        if self.nodes.get(node_id) is not node:
+            return self._linked_inputs(node)
+        links = self._input_links.get(node_id)
+        if links is None:
+            links = self._input_links[node_id] = self._linked_inputs(node)
+        return links
+
+
+def find_highest_order_saveimage(workflow, graph=None):
+    graph = graph or WorkflowGraph(workflow)
+    types = _matching_nodes(list(graph.nodes_by_type), lambda t: t)
+    cands = [entry for t in types for entry in graph.nodes_by_type[t]]
     if not cands:
         return None
-    return max(cands, key=lambda n: n.get("order", 0))
+    # highest order wins; ties go to the node listed first
+    return max(cands, key=lambda e: (e[1].get("order", 0), -e[0]))[1]
 
 
 def find_input_link_id(node, name):
@@ -73,96 +193,233 @@ def _link_source(link_map, link_id):
     return entry[0] if entry else None
 
 
-def bfs_upstream_to_positive_source(workflow, start_node):
+class _BfsMemo:
     """
-    Starting at the node that feeds SaveImage (e.g., VAEDecode, FaceDetailer),
-    walk upstream until we find a node with a 'positive' input. Return the node
-    that *produces* that 'positive' (its source node).
+    What the upstream searches of one kind over one graph have learned.
+    found: node -> (first matching node upstream, its distance), for every
+    node on the path a successful search took from its start to its match.
+    dead: nodes a failed search entered; nothing upstream of them matches.
     """
-    link_map = build_link_map(workflow)
-    q = deque([start_node])
-    seen = set()
+
+    def __init__(self):
+        self.found = {}
+        self.dead = set()
+
+
+def _upstream_bfs(start, visit, memo=None):
+    """
+    The first node, in breadth-first order upstream of start, that matches,
+    or None. visit(node) returns (matches, upstream neighbours in input
+    order). Nodes are hashable keys (node ids).
+
+    memo: optional _BfsMemo shared by the searches of one kind over one
+    graph, so searches from many start nodes cost about one walk in total.
+    A dead node is skipped. A node with a found result isn't expanded;
+    instead a stand-in for the path to its match moves one level down the
+    queue per pass and completes when it gets there, so it wins over other
+    matches exactly when the full walk would have reached its match first.
+    Every node on the path to the match then gets the result recorded: the
+    path is a breadth-first path, so a search from any node on it finds
+    the same match.
+    """
+    found = memo.found if memo is not None else {}
+    dead = memo.dead if memo is not None else ()
+    if start in dead:
+        return None
+    if start in found:
+        return found[start][0]
+
+    # (node, parent, depth, stand-in) -- stand-in is (match, levels left)
+    q = deque([(start, None, 0, None)])
+    walking = 1  # entries in q that aren't stand-ins
+    tree = {}  # node -> (parent, depth) for each node entered
+    end = None  # (last node of the path, depth of the match, match)
     while q:
-        node = q.popleft()
-        if node["id"] in seen:
+        node, parent, depth, stand_in = q.popleft()
+        if stand_in is not None:
+            match, left = stand_in
+            if left and not walking:
+                # Only stand-ins are left: the one due first is the answer.
+                # On ties, those already a level deeper were queued first at
+                # every level since, then queue order decides.
+                rest = [(node, depth, stand_in)] + [(n, d, si) for n, _, d, si in q]
+                node, depth, (match, left) = min(
+                    rest, key=lambda e: (e[1] + e[2][1], -e[1]))
+                left, depth = 0, depth + left
+            if not left:
+                end = (node, depth, match)
+                break
+            q.append((node, None, depth + 1, (match, left - 1)))
             continue
-        seen.add(node["id"])
+        walking -= 1
+        if node in tree or node in dead:
+            continue
+        tree[node] = (parent, depth)
+        if node in found:
+            match, distance = found[node]
+            if not distance:
+                end = (node, depth, match)
+                break
+            q.append((node, None, depth + 1, (match, distance - 1)))
+            continue
+        matches, upstream = visit(node)
+        if matches:
+            end = (node, depth, node)
+            break
+        for up in upstream:
+            q.append((up, node, depth + 1, None))
+            walking += 1
+
+    if end is None:
+        if memo is not None:
+            dead.update(tree)
+        return None
+    node, match_depth, match = end
+    if memo is not None:
+        while node is not None:
+            parent, depth = tree[node]
+            found[node] = (match, match_depth - depth)
+            node = parent
+    return match
+
+
+def _workflow_bfs(graph, start_node, visit, memo):
+    # _upstream_bfs over node ids; visit(node) -> (matches, upstream nodes)
+    start_id = start_node["id"]
+
+    def visit_id(node_id):
+        node = start_node if node_id == start_id else graph.node(node_id)
+        matches, upstream = visit(node)
+        return matches, [pred["id"] for pred in upstream]
+
+    found = _upstream_bfs(start_id, visit_id, memo)
+    if found is None:
+        return None
+    return start_node if found == start_id else graph.node(found)
 
-        for inp in node.get("inputs", []):
-            if inp.get("name") == "positive" and inp.get("link") is not None:
-                src_id = _link_source(link_map, inp["link"])
-                if src_id is not None:
-                    return get_node_by_id(workflow, src_id)
 
+def bfs_upstream_to_positive_source(workflow, start_node, graph=None, memo=None):
+    """
+    Starting at the node that feeds SaveImage (e.g., VAEDecode, FaceDetailer),
+    walk upstream until we find a node with a 'positive' input. Return the node
+    that *produces* that 'positive' (its source node).
+    memo: optional _BfsMemo shared by these searches over one graph.
+    """
+    graph = graph or WorkflowGraph(workflow)
+
+    def visit(node):
+        links = graph.input_links(node)
+        if any(inp.get("name") == "positive" and src_id is not None for inp, src_id in links):
+            return True, ()
         # keep walking upstream through all inputs
-        for inp in node.get("inputs", []):
-            if inp.get("link") is not None:
-                src_id = _link_source(link_map, inp["link"])
-                pred = get_node_by_id(workflow, src_id) if src_id is not None else None
-                if pred:
-                    q.append(pred)
-    return None
+        return False, [pred for pred in (graph.node(src_id) for _, src_id in links) if pred]
 
+    node = _workflow_bfs(graph, start_node, visit, memo)
+    if node is None:
+        return None
+    src_id = next(src_id for inp, src_id in graph.input_links(node)
+                  if inp.get("name") == "positive" and src_id is not None)
+    return graph.node(src_id)
 
-def find_upstream_clip_encode(workflow, start_node):
+
+def find_upstream_clip_encode(workflow, start_node, graph=None, memo=None):
     """
     From a CONDITIONING-producing node, walk upstream until a CLIPTextEncode* node is found.
+    memo: optional _BfsMemo shared by these searches over one graph.
     """
-    link_map = build_link_map(workflow)
-    q = deque([start_node])
-    seen = set()
-    while q:
-        node = q.popleft()
-        if node["id"] in seen:
-            continue
-        seen.add(node["id"])
+    graph = graph or WorkflowGraph(workflow)
 
+    def visit(node):
         if "CLIPTextEncode" in node.get("type", ""):
-            return node
+            return True, ()
+        return False, [pred for pred in (graph.node(src_id)
+                                         for inp, src_id in graph.input_links(node)
+                                         if inp.get("type") in ("CONDITIONING", "CLIP", "STRING", "any"))
+                       if pred]
 
-        for inp in node.get("inputs", []):
-            if inp.get("link") is not None and inp.get("type") in ("CONDITIONING", "CLIP", "STRING", "any"):
-                src_id = _link_source(link_map, inp["link"])
-                pred = get_node_by_id(workflow, src_id) if src_id is not None else None
-                if pred:
-                    q.append(pred)
-    return None
+    return _workflow_bfs(graph, start_node, visit, memo)
 
 
 def flatten_strings(x):
-    if isinstance(x, str):
-        return [x]
-    if isinstance(x, list):
-        out = []
-        for e in x:
-            out.extend(flatten_strings(e))
-        return out
-    return []
+    out = []
+    stack = [x]
+    while stack:
+        x = stack.pop()
+        if isinstance(x, str):
+            out.append(x)
+        elif isinstance(x, list):
+            stack.extend(reversed(x))
+    return out
 
 
-def extract_string_value_recursive(workflow, node):
+# Upper bound on nodes entered while resolving one prompt's text. Generated
+# workflows can chain 1000+ string nodes; far beyond that the graph is
+# pathological and the walk gives up rather than stall a worker.
+MAX_TEXT_WALK_NODES = 10000
+
+
+def _walk_text(start, key, expand, dead=None):
+    """
+    First non-empty text found by a depth-first walk from start, or None.
+    expand(node) yields, in priority order, ("text", candidate) or
+    ("node", upstream node to explore before the next item). Each node is
+    entered at most once (by key(node)), as in the recursive walk this
+    replaces; an explicit stack keeps deep chains off the Python stack. Gives
+    up after MAX_TEXT_WALK_NODES nodes.
+    dead: optional set of keys shared by walks over one graph. A walk that
+    finds nothing adds every node it entered, since nothing reachable from
+    them has text, and later walks skip those nodes.
+    """
+    if dead is not None and key(start) in dead:
+        return None
+    visited = {key(start)}
+    stack = [expand(start)]
+    while stack:
+        step = next(stack[-1], None)
+        if step is None:
+            stack.pop()
+            continue
+        kind, value = step
+        if kind == "text":
+            if value:
+                return value
+        elif key(value) not in visited and (dead is None or key(value) not in dead):
+            if len(visited) >= MAX_TEXT_WALK_NODES:
+                return None
+            visited.add(key(value))
+            stack.append(expand(value))
+    if dead is not None:
+        dead.update(visited)
+    return None
+
+
+def _clip_inline_text(n):
+    """A CLIPTextEncode's own widget text when its 'text' input isn't linked, else None."""
+    if "CLIPTextEncode" in n.get("type", ""):
+        # If 'text' is not linked, prefer its own widget value
+        text_input = next((i for i in n.get("inputs", []) if i.get("name") == "text"), None)
+        linked = bool(text_input and text_input.get("link") is not None)
+        wv = n.get("widgets_values", [])
+        if not linked and wv and isinstance(wv[0], str):
+            return wv[0].strip()
+    return None
+
+
+def extract_string_value_recursive(workflow, node, graph=None):
     """
     Resolve the actual prompt text. Priority:
       1) If CLIP node has no 'text' link, take its widget value (usually widgets_values[0]).
       2) Else follow its 'text' input link back. For generic nodes, try any STRING-typed input.
       3) When landing on nodes with widgets_values containing strings, pick the longest.
     """
-    link_map = build_link_map(workflow)
-    visited = set()
+    graph = graph or WorkflowGraph(workflow)
 
-    def helper(n):
-        if n["id"] in visited:
-            return None
-        visited.add(n["id"])
-
-        # Case: CLIP node with inline text
-        if "CLIPTextEncode" in n.get("type", ""):
-            # If 'text' is not linked, prefer its own widget value
-            text_input = next((i for i in n.get("inputs", []) if i.get("name") == "text"), None)
-            linked = bool(text_input and text_input.get("link") is not None)
-            wv = n.get("widgets_values", [])
-            if not linked and wv and isinstance(wv[0], str):
-                return wv[0].strip()
+    def expand(n):
+        # Case: CLIP node with inline text (final for this branch, even if empty)
+        inline = _clip_inline_text(n)
+        if inline is not None:
+            yield "text", inline
+            return
 
         # Generic string from widgets_values (ShowText etc.)
         wv = n.get("widgets_values", None)
@@ -170,62 +427,192 @@ def extract_string_value_recursive(workflow, node):
             strs = [s for s in flatten_strings(wv) if isinstance(s, str) and s.strip()]
             if strs:
                 # assume the real prompt is the longest string present
-                return max(strs, key=len).strip()
+                yield "text", max(strs, key=len).strip()
+                return
+
+        links = graph.input_links(n)
 
         # Follow 'text' input first if present
-        for inp in n.get("inputs", []):
-            if inp.get("name") == "text" and inp.get("link") is not None:
-                src_id = _link_source(link_map, inp["link"])
-                pred = get_node_by_id(workflow, src_id) if src_id is not None else None
+        for inp, src_id in links:
+            if inp.get("name") == "text":
+                pred = graph.node(src_id)
                 if pred:
-                    res = helper(pred)
-                    if res:
-                        return res
+                    yield "node", pred
 
         # Otherwise follow any STRING input
-        for inp in n.get("inputs", []):
-            if inp.get("type") == "STRING" and inp.get("link") is not None:
-                src_id = _link_source(link_map, inp["link"])
-                pred = get_node_by_id(workflow, src_id) if src_id is not None else None
+        for inp, src_id in links:
+            if inp.get("type") == "STRING":
+                pred = graph.node(src_id)
                 if pred:
-                    res = helper(pred)
-                    if res:
-                        return res
-        return None
+                    yield "node", pred
 
-    return helper(node)
+    return _walk_text(node, lambda n: n["id"], expand)
 
 
-def extract_from_workflow(workflow):
-    save = find_highest_order_saveimage(workflow)
+def _find_workflow_clip_node(workflow, graph):
+    """(CLIPTextEncode node feeding the saved image's positive, None) or (None, reason)."""
+    save = find_highest_order_saveimage(workflow, graph)
     if not save:
         return None, "no-saveimage"
+    return _clip_node_for_save(workflow, graph, save)
+
 
+def _clip_node_for_save(workflow, graph, save, memos=None):
+    """
+    (CLIPTextEncode node feeding this save node's positive, None) or (None,
+    reason). memos: optional (positive, CLIP) _BfsMemo pair shared by the
+    save nodes of one graph, so upstream nodes that several outputs reach
+    are searched from once.
+    """
     images_link = find_input_link_id(save, "images")
     if images_link is None:
         return None, "no-saveimage-images-link"
 
-    link_map = build_link_map(workflow)
-    src_id = _link_source(link_map, images_link)
-    start_node = get_node_by_id(workflow, src_id) if src_id is not None else None
+    start_node = graph.node(_link_source(graph.link_map, images_link))
     if not start_node:
         return None, "no-start-from-saveimage"
 
-    pos_src = bfs_upstream_to_positive_source(workflow, start_node)
+    positive_memo, clip_memo = memos or (None, None)
+    pos_src = bfs_upstream_to_positive_source(workflow, start_node, graph, positive_memo)
     if not pos_src:
         return None, "no-positive-found"
 
-    clip_node = find_upstream_clip_encode(workflow, pos_src)
+    clip_node = find_upstream_clip_encode(workflow, pos_src, graph, clip_memo)
     if not clip_node:
         return None, "no-clip-encode-upstream"
+    return clip_node, None
+
+
+def _key_part(value):
+    # JSON text for lists and dicts, so a key holding them becomes hashable
+    if isinstance(value, (list, dict)):
+        return ("json", json.dumps(value, default=repr))
+    if isinstance(value, tuple):
+        return tuple(_key_part(v) for v in value)
+    return value
 
-    prompt = extract_string_value_recursive(workflow, clip_node)
+
+def _hashable_key(key):
+    """
+    key, or with any list or dict in it replaced by its JSON text. The walks
+    tolerate those where a graph normally has scalars (e.g. a list as an
+    input's type), so the plan cache must too. Checked by hashing first:
+    normalising every part of a large key up front costs more than a walk.
+    """
+    try:
+        hash(key)
+    except TypeError:
+        return _key_part(key)
+    return key
+
+
+def _workflow_topology_key(workflow):
+    # Everything the save -> positive -> CLIP walk looks at; widget values
+    # (prompt text, seeds) are deliberately left out.
+    nodes = [(n.get("id"), n.get("type"), n.get("order"),
+              *[(i.get("name"), i.get("type"), i.get("link")) for i in n.get("inputs", [])])
+             for n in workflow.get("nodes", [])]
+    links = [tuple(rec) for rec in workflow.get("links", [])]
+    return _hashable_key((tuple(nodes), tuple(links)))
+
+
+def _plan_workflow(workflow, graph):
+    graph = graph or WorkflowGraph(workflow)
+    clip_node, err = _find_workflow_clip_node(workflow, graph)
+    if not clip_node:
+        return ("error", err)
+    return ("clip", graph.positions[clip_node["id"]])
+
+
+def _plan_workflow_outputs(workflow, graph):
+    """
+    ("outputs", ((save id, CLIP position or None, reason), ...)) for every
+    save node, highest execution order first; or ("error", "no-saveimage").
+    """
+    graph = graph or WorkflowGraph(workflow)
+    types = _matching_nodes(list(graph.nodes_by_type), lambda t: t)
+    saves = sorted((entry for t in types for entry in graph.nodes_by_type[t]),
+                   key=lambda e: (e[1].get("order", 0), -e[0]), reverse=True)
+    if not saves:
+        return ("error", "no-saveimage")
+    memos = (_BfsMemo(), _BfsMemo())
+    outputs = []
+    for _, save in saves:
+        clip_node, err = _clip_node_for_save(workflow, graph, save, memos)
+        outputs.append((save.get("id"), clip_node and graph.positions[clip_node["id"]], err))
+    return ("outputs", tuple(outputs))
+
+
+def _workflow_clip_text(workflow, clip_node, graph):
+    # Inline CLIP text needs no graph at all (the common case on a plan hit).
+    prompt = _clip_inline_text(clip_node)
+    if prompt is None:
+        prompt = extract_string_value_recursive(workflow, clip_node, graph)
+    return prompt
+
+
+def extract_from_workflow(workflow, graph=None, plan_cache=None):
+    """
+    graph: optional prebuilt WorkflowGraph for this workflow; built here if
+    omitted and shared by every stage below.
+    plan_cache: optional TopologyPlanCache; workflows with an already-seen
+    topology skip the graph walk and go straight to the CLIP node's text.
+    """
+    if plan_cache is None:
+        graph = graph or WorkflowGraph(workflow)
+        clip_node, err = _find_workflow_clip_node(workflow, graph)
+    else:
+        plan = plan_cache.get_or_compute("workflow", _workflow_topology_key(workflow),
+                                         lambda: _plan_workflow(workflow, graph))
+        if plan[0] == "error":
+            clip_node, err = None, plan[1]
+        else:
+            clip_node, err = workflow["nodes"][plan[1]], None
+    if not clip_node:
+        return None, err
+
+    prompt = _workflow_clip_text(workflow, clip_node, graph)
     if not prompt:
         return None, "no-prompt-resolved"
 
     return prompt, None
 
 
+def extract_all_from_workflow(workflow, graph=None, plan_cache=None):
+    """
+    ([(save node id, prompt), ...], None) for every save node whose prompt
+    resolves, highest execution order first, or (None, reason of the first
+    save node). The outputs' upstream searches share what they find (see
+    _upstream_bfs), so a search stops where it joins a path already found,
+    and each CLIP node's text is resolved once.
+    """
+    if plan_cache is None:
+        graph = graph or WorkflowGraph(workflow)
+        plan = _plan_workflow_outputs(workflow, graph)
+    else:
+        plan = plan_cache.get_or_compute("workflow:all", _workflow_topology_key(workflow),
+                                         lambda: _plan_workflow_outputs(workflow, graph))
+    if plan[0] == "error":
+        return None, plan[1]
+
+    rows = []
+    first_err = None
+    texts = {}  # CLIP position -> text
+    for save_id, clip_pos, err in plan[1]:
+        if clip_pos is not None and clip_pos not in texts:
+            if graph is None and _clip_inline_text(workflow["nodes"][clip_pos]) is None:
+                graph = WorkflowGraph(workflow)
+            texts[clip_pos] = _workflow_clip_text(workflow, workflow["nodes"][clip_pos], graph)
+        prompt = texts.get(clip_pos)
+        if prompt:
+            rows.append((save_id, prompt))
+        elif first_err is None:
+            first_err = err or "no-prompt-resolved"
+    if not rows:
+        return None, first_err
+    return rows, None
+
+
 # ---------------------------------------------------------------------------
 # Method 2: API prompt traversal (the "prompt" PNG chunk)
 #
@@ -242,121 +629,197 @@ def _api_link(value):
     return None
 
 
-def _api_resolve_text(prompt_graph, node_id, visited=None):
-    if visited is None:
-        visited = set()
-    if node_id in visited:
-        return None
-    visited.add(node_id)
+class _ApiSearchMemo:
+    """
+    Results shared by the searches from each save node candidate of one API
+    graph. positive and clip are the upstream searches' _BfsMemo; they
+    depend only on topology. texts caches node id -> resolved text
+    (including None), and dead_text holds the nodes a text walk that found
+    nothing entered.
+    """
 
-    node = prompt_graph.get(node_id)
-    if not isinstance(node, dict):
-        return None
-    inputs = node.get("inputs", {})
-    if not isinstance(inputs, dict):
-        return None
+    def __init__(self):
+        self.positive = _BfsMemo()
+        self.clip = _BfsMemo()
+        self.texts = {}
+        self.dead_text = set()
 
-    text = inputs.get("text")
-    if isinstance(text, str) and text.strip():
-        return text.strip()
-    src = _api_link(text)
-    if src:
-        res = _api_resolve_text(prompt_graph, src, visited)
-        if res:
-            return res
-
-    # Generic fallback: longest inline string among this node's inputs
-    strs = [v for v in inputs.values() if isinstance(v, str) and v.strip()]
-    if strs:
-        return max(strs, key=len).strip()
-
-    # Follow any remaining links
-    for value in inputs.values():
-        src = _api_link(value)
-        if src:
-            res = _api_resolve_text(prompt_graph, src, visited)
-            if res:
-                return res
-    return None
 
+def _api_bfs(prompt_graph, start_id, match, memo):
+    # Upstream BFS for the first node where match(node_id, node) returns a result.
+    def visit(node_id):
+        node = prompt_graph.get(node_id)
+        if not isinstance(node, dict):
+            return False, ()
+        if match(node_id, node):
+            return True, ()
+        inputs = node.get("inputs", {})
+        if not isinstance(inputs, dict):
+            return False, ()
+        return False, [link for link in map(_api_link, inputs.values()) if link]
 
-def _api_find_positive_source(prompt_graph, start_id):
-    q = deque([start_id])
-    seen = set()
-    while q:
-        node_id = q.popleft()
-        if node_id in seen:
-            continue
-        seen.add(node_id)
+    found = _upstream_bfs(start_id, visit, memo)
+    return found and match(found, prompt_graph[found])
+
+
+def _api_resolve_text(prompt_graph, node_id, memo=None):
+    if memo is not None and node_id in memo.texts:
+        return memo.texts[node_id]
 
+    def expand(node_id):
         node = prompt_graph.get(node_id)
         if not isinstance(node, dict):
-            continue
+            return
         inputs = node.get("inputs", {})
         if not isinstance(inputs, dict):
-            continue
+            return
 
-        src = _api_link(inputs.get("positive"))
+        text = inputs.get("text")
+        if isinstance(text, str) and text.strip():
+            yield "text", text.strip()
+            return
+        src = _api_link(text)
         if src:
-            return src
+            yield "node", src
+
+        # Generic fallback: longest inline string among this node's inputs
+        strs = [v for v in inputs.values() if isinstance(v, str) and v.strip()]
+        if strs:
+            yield "text", max(strs, key=len).strip()
+            return
 
+        # Follow any remaining links
         for value in inputs.values():
-            link = _api_link(value)
-            if link:
-                q.append(link)
-    return None
+            src = _api_link(value)
+            if src:
+                yield "node", src
+
+    text = _walk_text(node_id, lambda nid: nid, expand,
+                      memo.dead_text if memo is not None else None)
+    if memo is not None:
+        memo.texts[node_id] = text
+    return text
 
 
-def extract_from_api_prompt(prompt_graph):
-    candidates = [(nid, node) for nid, node in prompt_graph.items()
-                  if isinstance(node, dict)]
-    save_ids = [nid for nid, _ in
-                _matching_nodes(candidates, lambda c: c[1].get("class_type", ""))]
-    if not save_ids:
-        return None, "no-saveimage"
+def _api_positive_link(node_id, node):
+    inputs = node.get("inputs", {})
+    return _api_link(inputs.get("positive")) if isinstance(inputs, dict) else None
 
-    # No execution-order field in API format; try highest node id first.
-    def _sort_key(nid):
-        try:
-            return (1, int(nid))
-        except ValueError:
-            return (0, 0)
 
-    for save_id in sorted(save_ids, key=_sort_key, reverse=True):
-        pos_id = _api_find_positive_source(prompt_graph, save_id)
-        if not pos_id:
-            continue
-        # Prefer a CLIPTextEncode upstream of the positive source; otherwise
-        # resolve text from the positive source itself.
-        clip_id = _api_find_clip_encode(prompt_graph, pos_id)
-        text = _api_resolve_text(prompt_graph, clip_id or pos_id)
+def _api_find_positive_source(prompt_graph, start_id, memo=None):
+    return _api_bfs(prompt_graph, start_id, _api_positive_link,
+                    memo.positive if memo is not None else None)
+
+
+class _ApiPlan:
+    """
+    The save node candidates of one API graph, highest node id first, and
+    for each the node its text is resolved from, found the first time that
+    candidate is tried. Both depend only on the graph's topology, so one plan
+    serves every graph with that topology (see TopologyPlanCache), and a
+    caller that stops at the first candidate with text never searches from
+    the rest.
+    """
+
+    def __init__(self, prompt_graph):
+        by_type = {}  # class_type -> [(position, node id)]
+        for pos, (nid, node) in enumerate(prompt_graph.items()):
+            if isinstance(node, dict):
+                by_type.setdefault(node.get("class_type", ""), []).append((pos, nid))
+        save_ids = [nid for _, nid in sorted(
+            entry for t in _matching_nodes(list(by_type), lambda t: t) for entry in by_type[t])]
+
+        # No execution-order field in API format; try highest node id first.
+        def _sort_key(nid):
+            try:
+                return (1, int(nid))
+            except ValueError:
+                return (0, 0)
+
+        self.save_ids = sorted(save_ids, key=_sort_key, reverse=True)
+        self.error = None if self.save_ids else "no-saveimage"
+        self._memo = _ApiSearchMemo()
+        self._sources = {}  # save id -> node to resolve text from, or None
+        self._lock = threading.Lock()  # a cached plan may be shared by threads
+
+    def text_source(self, prompt_graph, save_id):
+        """Node to resolve save_id's text from, or None if it has no positive source."""
+        with self._lock:
+            if save_id not in self._sources:
+                source = pos_id = _api_find_positive_source(prompt_graph, save_id, self._memo)
+                if pos_id:
+                    # Prefer a CLIPTextEncode upstream of the positive source;
+                    # otherwise resolve text from the positive source itself.
+                    source = _api_find_clip_encode(prompt_graph, pos_id, self._memo) or pos_id
+                self._sources[save_id] = source
+            return self._sources[save_id]
+
+
+def _api_plan(prompt_graph, plan_cache):
+    if plan_cache is None:
+        return _ApiPlan(prompt_graph)
+    return plan_cache.get_or_compute("prompt", _api_topology_key(prompt_graph),
+                                     lambda: _ApiPlan(prompt_graph))
+
+
+def _api_topology_key(prompt_graph):
+    # class types and links only (see _api_link); inline input values are left out
+    items = []
+    for nid, node in prompt_graph.items():
+        inputs = node.get("inputs", {}) if isinstance(node, dict) else None
+        if isinstance(inputs, dict):
+            items.append((nid, node.get("class_type", ""),
+                          *[(k, v[0]) for k, v in inputs.items()
+                            if isinstance(v, list) and len(v) == 2 and isinstance(v[0], (str, int))]))
+        else:
+            items.append((nid, inputs))
+    return _hashable_key(tuple(items))
+
+
+def extract_from_api_prompt(prompt_graph, plan_cache=None):
+    """
+    plan_cache: optional TopologyPlanCache; graphs with an already-seen
+    topology skip the upstream searches and only resolve the text.
+    """
+    plan = _api_plan(prompt_graph, plan_cache)
+    if plan.error:
+        return None, plan.error
+    memo = _ApiSearchMemo()
+    for save_id in plan.save_ids:
+        source_id = plan.text_source(prompt_graph, save_id)
+        text = source_id and _api_resolve_text(prompt_graph, source_id, memo)
         if text:
             return text, None
     return None, "no-prompt-resolved"
 
 
-def _api_find_clip_encode(prompt_graph, start_id):
-    q = deque([start_id])
-    seen = set()
-    while q:
-        node_id = q.popleft()
-        if node_id in seen:
-            continue
-        seen.add(node_id)
+def extract_all_from_api_prompt(prompt_graph, plan_cache=None):
+    """
+    ([(save node id, prompt), ...], None) for every save node whose prompt
+    resolves, highest node id first, or (None, reason).
+    """
+    plan = _api_plan(prompt_graph, plan_cache)
+    if plan.error:
+        return None, plan.error
+    memo = _ApiSearchMemo()
+    rows = []
+    for save_id in plan.save_ids:
+        source_id = plan.text_source(prompt_graph, save_id)
+        text = source_id and _api_resolve_text(prompt_graph, source_id, memo)
+        if text:
+            rows.append((save_id, text))
+    if not rows:
+        return None, "no-prompt-resolved"
+    return rows, None
 
-        node = prompt_graph.get(node_id)
-        if not isinstance(node, dict):
-            continue
-        if "CLIPTextEncode" in node.get("class_type", ""):
-            return node_id
 
-        inputs = node.get("inputs", {})
-        if isinstance(inputs, dict):
-            for value in inputs.values():
-                link = _api_link(value)
-                if link:
-                    q.append(link)
-    return None
+def _api_clip_encode_id(node_id, node):
+    return node_id if "CLIPTextEncode" in node.get("class_type", "") else None
+
+
+def _api_find_clip_encode(prompt_graph, start_id, memo=None):
+    return _api_bfs(prompt_graph, start_id, _api_clip_encode_id,
+                    memo.clip if memo is not None else None)
 
 
 # ---------------------------------------------------------------------------
@@ -388,57 +851,630 @@ def extract_from_parameters(parameters):
     return positive, None
 
 
+# ---------------------------------------------------------------------------
+# PNG metadata reader
+#
+# Only the text chunks before the first IDAT are needed, so the file is walked
+# chunk by chunk and image data is never read or decoded. Pillow is kept as a
+# fallback for files this reader rejects (e.g. a JPEG saved with a .png name).
+# ---------------------------------------------------------------------------
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+TEXT_CHUNK_TYPES = (b"tEXt", b"zTXt", b"iTXt")
+# Upper bound on a single decompressed zTXt/iTXt chunk (guards against zip bombs).
+MAX_TEXT_CHUNK = 64 * 1024 * 1024
+
+
+def _inflate(data):
+    d = zlib.decompressobj()
+    out = d.decompress(data, MAX_TEXT_CHUNK)
+    if d.unconsumed_tail:
+        raise ValueError("decompressed text chunk too large")
+    return out
+
+
+def _text_payload_bytes(ctype, data):
+    """(text bytes, encoding) of a chunk given everything after its keyword's NUL separator."""
+    if ctype == b"tEXt":
+        return data, "latin-1"
+    if ctype == b"zTXt":
+        # data[0] is the compression method; 0 (zlib) is the only one defined
+        return _inflate(data[1:]), "latin-1"
+    # iTXt: compression flag, compression method, language tag, translated keyword, text
+    if len(data) < 2:
+        return b"", "utf-8"
+    compressed = data[0]
+    _lang, _, rest = data[2:].partition(b"\0")
+    _translated, _, text = rest.partition(b"\0")
+    if compressed:
+        text = _inflate(text)
+    return text, "utf-8"
+
+
+def _decode_text_payload(ctype, data):
+    """Text of a chunk given everything after its keyword's NUL separator."""
+    text, encoding = _text_payload_bytes(ctype, data)
+    return text.decode(encoding, "replace")
+
+
+class PngTextChunks(Mapping):
+    """
+    {keyword: text} view of a PNG's text chunks. Chunks are located when the
+    file is read but only decompressed and decoded the first time their key is
+    looked up, so a prompt found in "workflow" never pays for inflating the
+    "prompt" chunk.
+    """
+
+    def __init__(self):
+        self._chunks = {}   # keyword -> (chunk type, payload after the keyword)
+        self._decoded = {}
+
+    def add(self, ctype, data):
+        key, sep, payload = data.partition(b"\0")
+        if sep and key:
+            key = key.decode("latin-1")
+            self._chunks[key] = (ctype, payload)
+            self._decoded.pop(key, None)
+
+    def payloads(self):
+        """[(keyword, chunk type, payload)], e.g. to hand the chunks to another process."""
+        return [(key, ctype, payload) for key, (ctype, payload) in self._chunks.items()]
+
+    @classmethod
+    def from_payloads(cls, payloads):
+        """
+        Inverse of payloads(). A payload may be any bytes-like object, such as
+        a memoryview of shared memory; it is copied to bytes only when its
+        chunk is first consulted.
+        """
+        meta = cls()
+        for key, ctype, payload in payloads:
+            meta._chunks[key] = (ctype, payload)
+        return meta
+
+    def _chunk(self, key):
+        ctype, payload = self._chunks[key]
+        if not isinstance(payload, bytes):
+            payload = bytes(payload)
+            self._chunks[key] = (ctype, payload)
+        return ctype, payload
+
+    def raw(self, key):
+        """The undecoded chunk payload, e.g. for hashing without inflating it."""
+        ctype, payload = self._chunk(key)
+        return ctype + payload
+
+    def utf8(self, key):
+        """
+        The text as UTF-8 bytes if no transcoding is needed (ASCII tEXt/zTXt,
+        any iTXt), else None. Lets a bytes-based JSON parser skip the decode.
+        """
+        if key in self._decoded:
+            return None
+        text, encoding = _text_payload_bytes(*self._chunk(key))
+        if encoding == "utf-8" or text.isascii():
+            return text
+        return None
+
+    def __getitem__(self, key):
+        try:
+            return self._decoded[key]
+        except KeyError:
+            pass
+        value = _decode_text_payload(*self._chunk(key))
+        self._decoded[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self._chunks
+
+    def __iter__(self):
+        return iter(self._chunks)
+
+    def __len__(self):
+        return len(self._chunks)
+
+
+def read_png_text_chunks(png_path, stats=None):
+    """
+    Return a PngTextChunks mapping of the tEXt/zTXt/iTXt chunks that precede
+    the image data, matching what Pillow exposes as Image.info. Raises
+    ValueError if the file is not a well-formed PNG.
+    """
+    meta = PngTextChunks()
+    with open(png_path, "rb") as f:
+        if f.read(8) != PNG_SIGNATURE:
+            raise ValueError("not a PNG file")
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError("truncated PNG file")
+            length, ctype = struct.unpack(">I4s", header)
+            if ctype in (b"IDAT", b"IEND"):
+                break
+            if ctype not in TEXT_CHUNK_TYPES:
+                f.seek(length + 4, os.SEEK_CUR)  # skip data and CRC
+                continue
+            data = f.read(length)
+            if len(data) < length:
+                raise ValueError(f"truncated {ctype.decode('ascii')} chunk")
+            f.seek(4, os.SEEK_CUR)  # CRC
+            meta.add(ctype, data)
+        if stats is not None:
+            stats.record("bytes", "read", f.tell())
+    return meta
+
+
+def read_png_metadata(png_path, stats=None):
+    try:
+        return read_png_text_chunks(png_path, stats)
+    except ValueError:
+        if Image is None:
+            raise
+    with Image.open(png_path) as img:
+        return img.info
+
+
+# ---------------------------------------------------------------------------
+# Instrumentation
+#
+# Extraction code reports events as stats.record(kind, name, value):
+#   ("time", stage, seconds)     stages: read, decode:<chunk>, json:<method>,
+#                                walk:<method>, parameters, file (whole file)
+#   ("bytes", "read", n)         bytes of the file read up to the image data
+#   ("method", method, outcome)  "ok" or the error reason, e.g. "no-saveimage"
+#   ("count", name, n)           e.g. memo_hit, plan_hit, cache_hit,
+#                                prefilter_skip:<method> (json.loads avoided)
+# Any object with a record() method can be passed as `stats`.
+# ---------------------------------------------------------------------------
+
+class EventLog(list):
+    """Collects events as tuples, e.g. in a worker process for later replay."""
+
+    def record(self, kind, name, value):
+        self.append((kind, name, value))
+
+
+def _outcome_bucket(outcome):
+    # "error:KeyError: 'id'" -> "error:KeyError"; other reasons are already short
+    if outcome.startswith("error:"):
+        return ":".join(outcome.split(":", 2)[:2])
+    return outcome
+
+
+class ExtractionStats:
+    """
+    Aggregates events into per-stage wall time histograms, bytes read,
+    per-method outcome counts and files/sec. Every event is also passed to
+    each hook as hook(kind, name, value), so embedding code can observe a
+    run as it happens.
+    """
+
+    def __init__(self, hooks=()):
+        self.hooks = list(hooks)
+        self.started = time.perf_counter()
+        self.times = {}     # stage -> {"count", "total", "max", "histogram"}
+        self.bytes = {}
+        self.counts = {}
+        self.methods = {}   # method -> {outcome bucket: n}
+
+    def record(self, kind, name, value):
+        if kind == "time":
+            entry = self.times.setdefault(
+                name, {"count": 0, "total": 0.0, "max": 0.0, "histogram": {}})
+            entry["count"] += 1
+            entry["total"] += value
+            entry["max"] = max(entry["max"], value)
+            # power-of-two buckets in microseconds: 1, 2, 4, ...
+            bucket = 1 << max(0, int(value * 1e6)).bit_length()
+            entry["histogram"][bucket] = entry["histogram"].get(bucket, 0) + 1
+        elif kind == "bytes":
+            self.bytes[name] = self.bytes.get(name, 0) + value
+        elif kind == "count":
+            self.counts[name] = self.counts.get(name, 0) + value
+        elif kind == "method":
+            outcomes = self.methods.setdefault(name, {})
+            bucket = _outcome_bucket(value)
+            outcomes[bucket] = outcomes.get(bucket, 0) + 1
+        for hook in self.hooks:
+            hook(kind, name, value)
+
+    def replay(self, events):
+        for event in events:
+            self.record(*event)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        files = self.times.get("file", {}).get("count", 0) + self.counts.get("cache_hit", 0)
+        stages = {}
+        for stage, entry in self.times.items():
+            stages[stage] = {
+                "count": entry["count"],
+                "total_s": round(entry["total"], 6),
+                "mean_us": round(entry["total"] / entry["count"] * 1e6, 1),
+                "max_us": round(entry["max"] * 1e6, 1),
+                "histogram_us": {f"<{b}": n for b, n in sorted(entry["histogram"].items())},
+            }
+        return {
+            "elapsed_s": round(elapsed, 6),
+            "files": files,
+            "files_per_s": round(files / elapsed, 1) if elapsed else None,
+            "bytes": dict(self.bytes),
+            "counts": dict(self.counts),
+            "methods": {m: dict(o) for m, o in self.methods.items()},
+            "stages": stages,
+        }
+
+    def format_table(self):
+        summary = self.summary()
+        lines = [f"{summary['files']} files in {summary['elapsed_s']:.2f}s "
+                 f"({summary['files_per_s']} files/s), "
+                 f"{summary['bytes'].get('read', 0)} metadata bytes read"]
+        lines.append(f"  {'stage':<16}{'count':>9}{'total s':>11}{'mean us':>11}{'max us':>11}")
+        for stage, st in summary["stages"].items():
+            lines.append(f"  {stage:<16}{st['count']:>9}{st['total_s']:>11.3f}"
+                         f"{st['mean_us']:>11.1f}{st['max_us']:>11.1f}")
+        for method, outcomes in summary["methods"].items():
+            detail = ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items()))
+            lines.append(f"  {method}: {detail}")
+        for name, n in sorted(summary["counts"].items()):
+            lines.append(f"  {name}: {n}")
+        return "\n".join(lines)
+
+
+# ---------------------------------------------------------------------------
+# JSON backends
+#
+# Parsing the workflow/prompt chunks is most of the CPU time for large graphs.
+# orjson is used when installed; it parses UTF-8 bytes, so ASCII tEXt and all
+# iTXt chunks skip the str decode. It is stricter than json (no NaN/Infinity,
+# invalid UTF-8 is an error), so a chunk it rejects is parsed again with json
+# and the backend never changes which prompts are found.
+# ---------------------------------------------------------------------------
+
+JsonBackend = namedtuple("JsonBackend", "name loads takes_bytes")
+JSON_BACKENDS = {"json": JsonBackend("json", json.loads, False)}
+if orjson is not None:
+    JSON_BACKENDS["orjson"] = JsonBackend("orjson", orjson.loads, True)
+
+
+def get_json_backend(name="auto"):
+    """JsonBackend by name; 'auto' picks orjson when installed. ValueError if unavailable."""
+    if name == "auto":
+        name = "orjson" if "orjson" in JSON_BACKENDS else "json"
+    try:
+        return JSON_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"JSON backend {name!r} is not available "
+                         f"(installed: {', '.join(JSON_BACKENDS)})") from None
+
+
 # ---------------------------------------------------------------------------
 # Per-file extraction: try each metadata source in order
 # ---------------------------------------------------------------------------
 
-def extract_final_positive_prompt_from_png(png_path):
+DEFAULT_MEMO_SIZE = 256
+
+
+class ResultMemo:
+    """
+    Bounded LRU of per-chunk results keyed by a digest of the raw chunk text.
+    ComfyUI writes byte-identical workflow/prompt chunks into every image of a
+    batch, so a hit skips both json.loads and the graph walk. Safe to share
+    between threads; compute runs outside the lock, so two threads missing
+    on the same key may both compute it.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MEMO_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def thread_hits(self):
+        """Hits in the calling thread, for attributing them to its file."""
+        return getattr(self._local, "hits", 0)
+
+    def _key(self, method, raw):
+        if isinstance(raw, str):
+            raw = raw.encode("utf-8", "surrogatepass")
+        return (method, hashlib.blake2b(raw, digest_size=16).digest())
+
+    def get_or_compute(self, method, raw, compute):
+        """raw: the chunk as str, or its undecoded bytes (PngTextChunks.raw)."""
+        key = self._key(method, raw)
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._local.hits = self.thread_hits + 1
+                return result
+            self.misses += 1
+        result = compute()
+        with self._lock:
+            self._entries[key] = result
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return result
+
+
+def _decode_chunk(meta, key, stats, json_backend=None):
+    # A bytes-capable JSON backend gets the chunk's UTF-8 bytes when they are
+    # available as-is; everything else gets the decoded text.
+    start = time.perf_counter()
+    raw = None
+    if json_backend is not None and json_backend.takes_bytes and isinstance(meta, PngTextChunks):
+        raw = meta.utf8(key)
+    if raw is None:
+        raw = meta[key]
+    if stats is not None:
+        stats.record("time", f"decode:{key}", time.perf_counter() - start)
+    return raw
+
+
+class TopologyPlanCache(ResultMemo):
+    """
+    Resolved traversal paths keyed by graph topology: node ids, types and
+    links, but not widget values. Images from one workflow differ only in
+    prompt text and seeds, so after the first one the save -> positive ->
+    CLIP walk is skipped and only the text is read from the cached node.
+    Keys are the topology tuples themselves, so a hit is an exact match.
+    """
+
+    def _key(self, method, topology):
+        return (method, topology)
+
+
+# A graph that never mentions a save node type (or, for a workflow,
+# CLIPTextEncode) can't yield a prompt, and a substring scan of the raw text
+# is far cheaper than json.loads. JSON may spell those letters as \u00XX
+# escapes, so a chunk that uses one is always parsed. Without parsing, a
+# rejected chunk could have failed for another reason (malformed JSON, a
+# graph that isn't an object, no save node wired to a sampler), so these
+# skips get reasons of their own.
+_PREFILTER = {}  # chunk type -> (save markers, CLIP marker, escape pattern)
+
+
+def _compile_prefilter():
+    markers = SAVE_NODE_MARKERS + FALLBACK_NODE_MARKERS
+    # A non-ASCII marker could also be written as a \uXXXX escape.
+    escape = r"\\u00[2-7]" if all(m.isascii() for m in markers) else r"\\u"
+    _PREFILTER[str] = (markers, "CLIPTextEncode", re.compile(escape))
+    _PREFILTER[bytes] = (tuple(m.encode("utf-8") for m in markers), b"CLIPTextEncode",
+                         re.compile(escape.encode("ascii")))
+
+
+_compile_node_markers()
+
+
+def _prefilter_reason(key, raw):
+    """The reason to skip raw if it can't hold what `key` needs, else None."""
+    markers, clip_marker, escape = _PREFILTER[type(raw)]
+    if not any(marker in raw for marker in markers):
+        reason = "prefiltered:no-saveimage"
+    elif key == "workflow" and clip_marker not in raw:
+        reason = "prefiltered:no-clip-encode"
+    else:
+        return None
+    if escape.search(raw):
+        return None
+    return reason
+
+
+def _loads(raw, json_backend, meta, key):
+    try:
+        return json_backend.loads(raw)
+    except json.JSONDecodeError:
+        if json_backend.loads is json.loads:
+            raise
+        # Stricter than json (see JSON backends): let json have the last word.
+        return json.loads(meta[key])
+
+
+def _extract_json_chunk(key, meta, extract, stats=None, json_backend=None):
+    # (None, None) means the chunk is empty and should be ignored
+    json_backend = json_backend or get_json_backend()
     try:
-        with Image.open(png_path) as img:
-            meta = img.info
+        raw = _decode_chunk(meta, key, stats, json_backend)
+        if not raw:
+            return None, None
+        reason = _prefilter_reason(key, raw)
+        if reason:
+            if stats is not None:
+                stats.record("count", f"prefilter_skip:{key}", 1)
+            return None, reason
+        start = time.perf_counter()
+        graph = _loads(raw, json_backend, meta, key)
+        if stats is not None:
+            stats.record("time", f"json:{key}", time.perf_counter() - start)
+        if not isinstance(graph, dict):
+            return None, "bad-json:not-an-object"
+        start = time.perf_counter()
+        result = extract(graph)
+        if stats is not None:
+            stats.record("time", f"walk:{key}", time.perf_counter() - start)
+        return result
+    except json.JSONDecodeError:
+        return None, "bad-json"
     except Exception as e:
         return None, f"error:{type(e).__name__}: {e}"
 
+
+def _extract_parameters_chunk(meta, stats=None):
+    try:
+        raw = _decode_chunk(meta, "parameters", stats)
+    except Exception as e:
+        return None, f"error:{type(e).__name__}: {e}"
+    if not raw:
+        return None, None
+    start = time.perf_counter()
+    result = extract_from_parameters(raw)
+    if stats is not None:
+        stats.record("time", "parameters", time.perf_counter() - start)
+    return result
+
+
+# Metadata sources, in the order they are tried by default.
+METHODS = ("workflow", "prompt", "parameters")
+_JSON_METHODS = {"workflow": extract_from_workflow, "prompt": extract_from_api_prompt}
+_JSON_METHODS_ALL = {"workflow": extract_all_from_workflow, "prompt": extract_all_from_api_prompt}
+
+
+def parse_method_order(text):
+    """'prompt,workflow' -> ("prompt", "workflow"); 'auto' -> AdaptiveMethodOrder()."""
+    if text.strip() == "auto":
+        return AdaptiveMethodOrder()
+    order = tuple(m.strip() for m in text.split(",") if m.strip())
+    unknown = [m for m in order if m not in METHODS]
+    if unknown or not order or len(set(order)) != len(order):
+        raise ValueError(f"method order must be 'auto' or a list of distinct methods "
+                         f"from {', '.join(METHODS)}: {text!r}")
+    return order
+
+
+class AdaptiveMethodOrder:
+    """
+    Tries methods in order of their success rate so far in this run. Only
+    attempts count (a missing chunk costs nothing); rates start at 1/2 so an
+    untried method sits between reliable and failing ones, and ties keep the
+    default order. On a folder of API-generated images whose workflow graph
+    can't be walked (e.g. subgraphs), "prompt" moves ahead of "workflow" after
+    a few files and the large workflow chunk is no longer parsed. Threads may
+    share one; each worker process gets its own copy.
+    """
+
+    def __init__(self, methods=METHODS):
+        self.methods = tuple(methods)
+        self.attempts = dict.fromkeys(self.methods, 0)
+        self.successes = dict.fromkeys(self.methods, 0)
+        self._order = self.methods
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def order(self):
+        return self._order
+
+    def record(self, method, ok):
+        rank = {m: i for i, m in enumerate(self.methods)}
+        with self._lock:
+            self.attempts[method] += 1
+            if ok:
+                self.successes[method] += 1
+            self._order = tuple(sorted(
+                self.methods,
+                key=lambda m: (-(self.successes[m] + 1) / (self.attempts[m] + 2), rank[m])))
+
+
+def _extract_graph_chunk(key, meta, memo, stats, plan_cache, json_backend, all_outputs=False):
+    extract = (_JSON_METHODS_ALL if all_outputs else _JSON_METHODS)[key]
+    if plan_cache is not None:
+        extract = partial(extract, plan_cache=plan_cache)
+        plan_hits = plan_cache.thread_hits
+    if memo is None:
+        result = _extract_json_chunk(key, meta, extract, stats, json_backend)
+    else:
+        # Hash the undecoded chunk when possible so a hit skips inflating it too.
+        raw = meta.raw(key) if isinstance(meta, PngTextChunks) else meta[key]
+        hits = memo.thread_hits
+        result = memo.get_or_compute(
+            f"{key}:all" if all_outputs else key, raw,
+            lambda: _extract_json_chunk(key, meta, extract, stats, json_backend))
+        if stats is not None and memo.thread_hits > hits:
+            stats.record("count", "memo_hit", 1)
+    if stats is not None and plan_cache is not None and plan_cache.thread_hits > plan_hits:
+        stats.record("count", "plan_hit", 1)
+    return result
+
+
+def extract_final_positive_prompt_from_png(png_path, memo=None, stats=None, method_order=None,
+                                           plan_cache=None, json_backend=None):
+    """
+    Return (prompt, None) or (None, reason). memo: optional ResultMemo reused
+    across calls so identical workflow/prompt chunks are only parsed once.
+    stats: optional event sink (see ExtractionStats). method_order: sequence
+    of METHODS to try (default: all, in order) or an AdaptiveMethodOrder.
+    plan_cache: optional TopologyPlanCache shared across calls.
+    json_backend: JsonBackend for the graph chunks (default: get_json_backend()).
+    """
+    start = time.perf_counter()
+    result = _extract_png(png_path, memo, stats, method_order or METHODS, plan_cache,
+                          json_backend or get_json_backend())
+    if stats is not None:
+        stats.record("time", "file", time.perf_counter() - start)
+    return result
+
+
+def extract_all_positive_prompts_from_png(png_path, memo=None, stats=None, method_order=None,
+                                          plan_cache=None, json_backend=None):
+    """
+    Like extract_final_positive_prompt_from_png, but with one prompt per save
+    node: ([(save node id, prompt), ...], None) or (None, reason). The first
+    method that resolves any output supplies all of them; "parameters" has no
+    save nodes, so its prompt comes back with id None.
+    """
+    start = time.perf_counter()
+    result = _extract_png(png_path, memo, stats, method_order or METHODS, plan_cache,
+                          json_backend or get_json_backend(), all_outputs=True)
+    if stats is not None:
+        stats.record("time", "file", time.perf_counter() - start)
+    return result
+
+
+def _read_png(png_path, stats):
+    """(text chunks, None) or (None, reason)."""
+    try:
+        start = time.perf_counter()
+        meta = read_png_metadata(png_path, stats)
+        if stats is not None:
+            stats.record("time", "read", time.perf_counter() - start)
+    except Exception as e:
+        return None, f"error:{type(e).__name__}: {e}"
+    return meta, None
+
+
+def _extract_png(png_path, memo, stats, method_order, plan_cache, json_backend,
+                 all_outputs=False):
+    meta, err = _read_png(png_path, stats)
+    if err:
+        return None, err
+    return _extract_meta(meta, memo, stats, method_order, plan_cache, json_backend, all_outputs)
+
+
+def _extract_meta(meta, memo, stats, method_order, plan_cache, json_backend, all_outputs):
+    adaptive = isinstance(method_order, AdaptiveMethodOrder)
     errors = []
 
-    wf_raw = meta.get("workflow")
-    if wf_raw:
-        try:
-            workflow = json.loads(wf_raw)
-            if isinstance(workflow, dict):
-                prompt, err = extract_from_workflow(workflow)
-                if prompt:
-                    return prompt, None
-                errors.append(f"workflow:{err}")
-            else:
-                errors.append("workflow:bad-json:not-an-object")
-        except json.JSONDecodeError:
-            errors.append("workflow:bad-json")
-        except Exception as e:
-            errors.append(f"workflow:error:{type(e).__name__}: {e}")
-
-    api_raw = meta.get("prompt")
-    if api_raw:
-        try:
-            prompt_graph = json.loads(api_raw)
-            if isinstance(prompt_graph, dict):
-                prompt, err = extract_from_api_prompt(prompt_graph)
-                if prompt:
-                    return prompt, None
-                errors.append(f"prompt:{err}")
-            else:
-                errors.append("prompt:bad-json:not-an-object")
-        except json.JSONDecodeError:
-            errors.append("prompt:bad-json")
-        except Exception as e:
-            errors.append(f"prompt:error:{type(e).__name__}: {e}")
-
-    params_raw = meta.get("parameters")
-    if params_raw:
-        prompt, err = extract_from_parameters(params_raw)
+    for key in (method_order.order() if adaptive else method_order):
+        if key not in meta:
+            continue
+        if key == "parameters":
+            prompt, err = _extract_parameters_chunk(meta, stats)
+            if all_outputs and prompt:
+                prompt = [(None, prompt)]
+        else:
+            prompt, err = _extract_graph_chunk(key, meta, memo, stats, plan_cache, json_backend,
+                                               all_outputs)
+        if prompt is None and err is None:
+            continue
+        if stats is not None:
+            stats.record("method", key, "ok" if prompt else err)
+        if adaptive:
+            method_order.record(key, bool(prompt))
         if prompt:
             return prompt, None
-        errors.append(f"parameters:{err}")
+        errors.append(f"{key}:{err}")
 
     if not errors:
         return None, "no-metadata"
@@ -449,12 +1485,68 @@ def extract_final_positive_prompt_from_png(png_path):
 # Output
 # ---------------------------------------------------------------------------
 
-def write_txt(output_path, rows):
-    # rows: list of (filename, prompt)
-    with open(output_path, "w", encoding="utf-8") as f:
-        for _, prompt in rows:
-            one_line = " ".join(prompt.replace("\r", " ").replace("\n", " ").split())
-            f.write(one_line + "\n")
+# Rows are streamed to "<output>.part" and renamed over the output when the
+# run completes, so a crash leaves the rows written so far in the .part file
+# and never a truncated file under the final name.
+
+class _StreamWriter:
+    FLUSH_INTERVAL = 2.0  # seconds
+    newline = None
+
+    def __init__(self, output_path, with_output=False, resume_offset=None):
+        # with_output: rows carry the save node id (--all-outputs)
+        # resume_offset: append to an existing .part file, first cutting off
+        # anything written after that offset (see Checkpoints)
+        self.output_path = output_path
+        self.part_path = output_path + ".part"
+        self.with_output = with_output
+        self.rows = 0
+        if resume_offset is None:
+            self._f = open(self.part_path, "w", encoding="utf-8", newline=self.newline)
+        else:
+            self._f = open(self.part_path, "r+", encoding="utf-8", newline=self.newline)
+            self._f.truncate(resume_offset)
+            self._f.seek(0, os.SEEK_END)
+        self._last_flush = time.monotonic()
+
+    def write(self, filename, prompt, output=None):
+        self._write_row(filename, prompt, output)
+        self.rows += 1
+        now = time.monotonic()
+        if now - self._last_flush >= self.FLUSH_INTERVAL:
+            self._f.flush()
+            self._last_flush = now
+
+    def sync(self):
+        """Flush the rows written so far to disk; return the .part file's size."""
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._last_flush = time.monotonic()
+        return os.fstat(self._f.fileno()).st_size
+
+    def close(self):
+        """Finish the file and move it into place."""
+        self._f.close()
+        os.replace(self.part_path, self.output_path)
+
+    def abort(self):
+        """Flush and close, leaving the partial output in the .part file."""
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class TxtWriter(_StreamWriter):
+    def _write_row(self, filename, prompt, output):
+        one_line = " ".join(prompt.replace("\r", " ").replace("\n", " ").split())
+        self._f.write(one_line + "\n")
 
 
 def _csv_safe_cell(value):
@@ -467,28 +1559,841 @@ def _csv_safe_cell(value):
     return text
 
 
+class CsvWriter(_StreamWriter):
+    newline = ""
+
+    def __init__(self, output_path, with_output=False, resume_offset=None):
+        super().__init__(output_path, with_output, resume_offset)
+        self._writer = csv.writer(self._f)
+        if resume_offset is None:
+            self._writer.writerow(["filename", "output", "prompt"] if with_output
+                                  else ["filename", "prompt"])
+
+    def _write_row(self, filename, prompt, output):
+        if self.with_output:
+            row = [filename, "" if output is None else output, prompt]
+        else:
+            row = [filename, prompt]
+        self._writer.writerow([_csv_safe_cell(cell) for cell in row])
+
+
+class JsonlWriter(_StreamWriter):
+    newline = ""
+
+    def _write_row(self, filename, prompt, output):
+        row = {"filename": filename, "prompt": prompt}
+        if self.with_output:
+            row = {"filename": filename, "output": output, "prompt": prompt}
+        self._f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+
+def writer_for_path(output_path, force_csv=False):
+    """Pick the writer class from the output file extension (.csv, .jsonl, else text)."""
+    lower = output_path.lower()
+    if force_csv or lower.endswith(".csv"):
+        return CsvWriter
+    if lower.endswith(".jsonl"):
+        return JsonlWriter
+    return TxtWriter
+
+
+def write_txt(output_path, rows):
+    # rows: iterable of (filename, prompt)
+    with TxtWriter(output_path) as w:
+        for fn, prompt in rows:
+            w.write(fn, prompt)
+
+
 def write_csv(output_path, rows):
-    with open(output_path, "w", encoding="utf-8", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["filename", "prompt"])
+    with CsvWriter(output_path) as w:
         for fn, prompt in rows:
-            writer.writerow([_csv_safe_cell(fn), _csv_safe_cell(prompt)])
+            w.write(fn, prompt)
+
+
+# ---------------------------------------------------------------------------
+# Input discovery
+# ---------------------------------------------------------------------------
+
+# name is relative to the input folder; size/mtime_ns come from the directory
+# scan (None if the file could not be stat'ed) and feed the result cache.
+PngFile = namedtuple("PngFile", "name path size mtime_ns")
+
+DEFAULT_SCAN_THREADS = 8
+# Directory scans in flight, or listed but not yet consumed, per scan thread.
+SCAN_WINDOW = 4
+
+
+def _scan_dir(path, rel):
+    """Return (sorted PngFiles, sorted (subdir path, subdir rel name)) for one directory."""
+    files = []
+    dirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                if entry.is_dir():
+                    # like os.walk: list symlinked dirs, don't descend into them
+                    if not entry.is_symlink():
+                        dirs.append((entry.path, os.path.join(rel, entry.name) if rel else entry.name))
+                    continue
+                if not entry.name.lower().endswith(".png"):
+                    continue
+            except OSError:
+                continue
+            name = os.path.join(rel, entry.name) if rel else entry.name
+            try:
+                st = entry.stat()
+                files.append(PngFile(name, entry.path, st.st_size, st.st_mtime_ns))
+            except OSError:
+                files.append(PngFile(name, entry.path, None, None))
+    files.sort()
+    dirs.sort()
+    return files, dirs
+
+
+def _scan_tree_sequential(path, rel):
+    files, dirs = _scan_dir(path, rel)
+    yield from files
+    for sub_path, sub_rel in dirs:
+        try:
+            yield from _scan_tree_sequential(sub_path, sub_rel)
+        except OSError:
+            continue
+
+
+def _scan_tree_threaded(pool, path, rel, window):
+    """
+    Directories are scanned ahead of the consumer, in the sorted depth-first
+    order it will reach them, with at most `window` scans in flight or listed
+    but not yet consumed, so memory stays bounded however large the tree.
+    Results are consumed in that order regardless of which scan finishes first.
+    """
+    # A node is [path, rel, future, child nodes once its listing is known];
+    # the stack holds the nodes still to consume, the next one last.
+    stack = [[path, rel, None, None]]
+    outstanding = 0
+
+    def children(node):
+        if node[3] is None and node[2] is not None and node[2].done():
+            try:
+                node[3] = [[p, r, None, None] for p, r in node[2].result()[1]]
+            except OSError:
+                node[3] = []
+        return node[3] or ()
+
+    def ahead(nodes):
+        # Known nodes in consumption order, looking into finished listings.
+        for node in nodes:
+            yield node
+            yield from ahead(children(node))
+
+    def top_up():
+        nonlocal outstanding
+        for node in ahead(reversed(stack)):
+            if outstanding >= window:
+                return
+            if node[2] is None:
+                node[2] = pool.submit(_scan_dir, node[0], node[1])
+                outstanding += 1
+
+    top_up()
+    while stack:
+        node = stack.pop()
+        try:
+            files = node[2].result()[0]
+        except OSError:
+            files = ()
+        outstanding -= 1
+        stack.extend(reversed(children(node)))
+        top_up()
+        yield from files
+
+
+def scan_png_files(input_folder, recursive=False, threads=DEFAULT_SCAN_THREADS):
+    """
+    Yield a PngFile for each .png in input_folder (and its subfolders when
+    recursive), sorted by name within each folder, files before subfolders.
+    Subfolders are listed by a pool of `threads` threads, which hides the
+    per-directory latency of network filesystems; they list only a few
+    folders per thread ahead of what has been consumed.
+    """
+    if not recursive:
+        yield from _scan_dir(input_folder, "")[0]
+        return
+    if threads <= 1:
+        yield from _scan_tree_sequential(input_folder, "")
+        return
+    pool = ThreadPoolExecutor(max_workers=threads)
+    try:
+        yield from _scan_tree_threaded(pool, input_folder, "", threads * SCAN_WINDOW)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
 
 
 def iter_png_files(input_folder, recursive=False):
-    if recursive:
-        for root, _, files in os.walk(input_folder):
-            for name in sorted(files):
-                if name.lower().endswith(".png"):
-                    full = os.path.join(root, name)
-                    yield os.path.relpath(full, input_folder), full
+    for f in scan_png_files(input_folder, recursive=recursive):
+        yield f.name, f.path
+
+
+# ---------------------------------------------------------------------------
+# Incremental cache: results of earlier runs keyed by (path, size, mtime)
+# ---------------------------------------------------------------------------
+
+# Bump when extraction logic changes so stale results are not reused.
+CACHE_VERSION = 2
+DEFAULT_CACHE_NAME = ".extract_prompts_cache.sqlite3"
+
+
+class ExtractionCache:
+    """
+    SQLite table mapping (relative path, size, mtime_ns) -> (prompt, error).
+    A file whose size or mtime changed is simply a miss. The whole table is
+    discarded when CACHE_VERSION or the extraction settings (e.g. the method
+    order) differ from the ones that wrote it.
+    """
+
+    COMMIT_EVERY = 1000
+
+    def __init__(self, db_path, rebuild=False, settings=""):
+        self.db_path = db_path
+        self.hits = 0
+        self._pending = 0
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, prompt TEXT, error TEXT)"
+        )
+        stored = dict(self.conn.execute("SELECT key, value FROM meta"))
+        wanted = {"version": str(CACHE_VERSION), "settings": settings}
+        if rebuild or any(stored.get(k) != v for k, v in wanted.items()):
+            self.conn.execute("DELETE FROM results")
+            self.conn.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", wanted.items())
+        self.conn.commit()
+
+    def get(self, name, size, mtime_ns):
+        row = self.conn.execute(
+            "SELECT prompt, error FROM results WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (name, size, mtime_ns),
+        ).fetchone()
+        if row is not None:
+            self.hits += 1
+        return row
+
+    def put(self, name, size, mtime_ns, prompt, err):
+        self.conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                          (name, size, mtime_ns, prompt, err))
+        self._pending += 1
+        if self._pending >= self.COMMIT_EVERY:
+            self.conn.commit()
+            self._pending = 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+# Cache lookups run as the extractors ask for work, so rows go out while
+# the folder is still being looked up. When this many files are looked up
+# but not yet yielded (a long run of hits ahead of an extraction still in
+# progress), lookups pause until the caller has taken some of them, which
+# keeps memory bounded; the extractors, and their pool, keep running.
+CACHE_LOOKAHEAD = 4096
+
+
+def iter_extracted_cached(files, cache, jobs=1, memo_size=DEFAULT_MEMO_SIZE, stats=None,
+                          method_order=None, json_backend="auto", all_outputs=False,
+                          read_threads=0, shared_memory=False, batch_size=None,
+                          executor=None):
+    """
+    Like iter_extracted, but for PngFile entries: results for files unchanged
+    since they were cached are reused and only the rest are extracted. With
+    all_outputs the per-output rows are stored as JSON, so the cache's
+    settings must say so. files may be lazy; it is read as results are
+    consumed, at most CACHE_LOOKAHEAD entries ahead.
+    """
+    backlog = deque()  # (entry, cached (prompt, error) or None), in input order
+
+    def misses():
+        for f in files:
+            while len(backlog) >= CACHE_LOOKAHEAD:
+                yield _PAUSE
+            hit = cache.get(f.name, f.size, f.mtime_ns) if f.size is not None else None
+            backlog.append((f, hit))
+            if hit is None:
+                yield f
+
+    fresh = iter_extracted(misses(), jobs=jobs, memo_size=memo_size, stats=stats,
+                           method_order=method_order, json_backend=json_backend,
+                           all_outputs=all_outputs, read_threads=read_threads,
+                           shared_memory=shared_memory, batch_size=batch_size,
+                           executor=executor)
+    extracted = deque()  # results for the misses in backlog, in order
+    try:
+        while True:
+            if not backlog or (backlog[0][1] is None and not extracted):
+                # Pulling a result lets the extractors look further ahead; a
+                # pause means everything looked up so far can be yielded.
+                result = next(fresh, None)
+                if result is None and not backlog:
+                    return
+                if result is not None and result is not _PAUSE:
+                    extracted.append(result)
+                continue
+            f, hit = backlog.popleft()
+            if hit is not None:
+                prompt, err = hit
+                if all_outputs and prompt:
+                    prompt = [tuple(row) for row in json.loads(prompt)]
+                if stats is not None:
+                    stats.record("count", "cache_hit", 1)
+            else:
+                _, prompt, err = extracted.popleft()
+                # "error:" means the file itself could not be read; that may be
+                # transient, so it is retried next run instead of cached.
+                if f.size is not None and not (err and err.startswith("error:")):
+                    stored = json.dumps(prompt) if all_outputs and prompt else prompt
+                    cache.put(f.name, f.size, f.mtime_ns, stored, err)
+            yield f.name, prompt, err
+    finally:
+        fresh.close()
+
+
+class _ExtractorState:
+    """
+    What one pool shares across its files: the chunk memo, plan cache and
+    method order, and the run's settings. A worker process builds its own
+    (see _init_worker); a thread pool shares one between its threads, which
+    is safe because the memo, plan cache and AdaptiveMethodOrder lock their
+    updates, the save node registry is only read during a run, and
+    everything else a file touches is local to its call. Events
+    go to a per-task EventLog, replayed by the consumer.
+    """
+
+    def __init__(self, memo_size, collect_events, method_order, json_backend, all_outputs):
+        self.memo = ResultMemo(memo_size) if memo_size else None
+        self.plan_cache = TopologyPlanCache(memo_size) if memo_size else None
+        self.collect_events = collect_events
+        self.method_order = method_order
+        self.json_backend = get_json_backend(json_backend)
+        self.all_outputs = all_outputs
+
+    def extract_batch(self, paths):
+        """One result list, event log and the time spent extracting, per batch."""
+        events = EventLog() if self.collect_events else None
+        extract = (extract_all_positive_prompts_from_png if self.all_outputs
+                   else extract_final_positive_prompt_from_png)
+        start = time.perf_counter()
+        results = [extract(path, memo=self.memo, stats=events, method_order=self.method_order,
+                           plan_cache=self.plan_cache, json_backend=self.json_backend)
+                   for path in paths]
+        return results, time.perf_counter() - start, events
+
+    def extract_read(self, read):
+        events = EventLog() if self.collect_events else None
+        prompt, err = _extract_read(read, self.memo, events, self.method_order,
+                                    self.plan_cache, self.json_backend, self.all_outputs)
+        return prompt, err, events
+
+
+# Per-process state for pool workers, set up by _init_worker.
+_worker = None
+_worker_shared = {}  # shared memory block name -> attached SharedMemory
+
+
+def _worker_initargs(memo_size, stats, method_order, json_backend, all_outputs):
+    return (memo_size, stats is not None, method_order, json_backend,
+            (SAVE_NODE_MARKERS, FALLBACK_NODE_MARKERS), all_outputs)
+
+
+def _init_worker(memo_size, collect_events, method_order, json_backend, node_markers,
+                 all_outputs=False):
+    global _worker
+    # Mirror the parent's registered save node types (not inherited when spawned).
+    save_markers, fallback_markers = node_markers
+    for marker in save_markers:
+        register_save_node_type(marker)
+    for marker in fallback_markers:
+        register_save_node_type(marker, fallback=True)
+    _worker = _ExtractorState(memo_size, collect_events, method_order, json_backend,
+                              all_outputs)
+
+
+def _extract_batch_in_worker(paths):
+    return _worker.extract_batch(paths)
+
+
+def _extract_read_in_worker(read):
+    if isinstance(read[0], SharedChunks):
+        read = (_attach_chunks(read[0]),) + read[1:]
+    return _worker.extract_read(read)
+
+
+EXECUTORS = ("threads", "processes")
+
+
+def default_executor():
+    """
+    "threads" on a free-threaded (no-GIL) CPython build, where threads parse
+    and walk graphs in parallel without process startup or pickling costs;
+    "processes" otherwise.
+    """
+    gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return "threads" if gil_enabled is not None and not gil_enabled() else "processes"
+
+
+def _extractor_pool(stack, executor, jobs, memo_size, stats, method_order, json_backend,
+                    all_outputs):
+    """(pool, batch function, read function) for `jobs` workers, entered on stack."""
+    if executor == "threads":
+        state = _ExtractorState(memo_size, stats is not None, method_order, json_backend,
+                                all_outputs)
+        pool = stack.enter_context(ThreadPoolExecutor(jobs))
+        return pool, state.extract_batch, state.extract_read
+    if executor != "processes":
+        raise ValueError(f"unknown executor {executor!r} (expected one of {EXECUTORS})")
+    pool = stack.enter_context(ProcessPoolExecutor(
+        max_workers=jobs, initializer=_init_worker,
+        initargs=_worker_initargs(memo_size, stats, method_order, json_backend, all_outputs)))
+    return pool, _extract_batch_in_worker, _extract_read_in_worker
+
+
+# ---------------------------------------------------------------------------
+# Batched dispatch (--jobs)
+#
+# Extracting a file takes around a millisecond, comparable to the cost of a
+# pool task (a future, and a pickle round trip through the call queue). So
+# paths go to the workers in batches and come back as one result list per
+# batch. The batch size follows the per-file time the workers report: large
+# enough that a batch takes about BATCH_TARGET_SECONDS, but split finer
+# towards the end of the run so no worker sits idle while another finishes
+# a big batch. Consecutive files share a worker, which also keeps the images
+# of one ComfyUI batch on the same chunk memo.
+# ---------------------------------------------------------------------------
+
+BATCH_TARGET_SECONDS = 0.05
+MAX_BATCH_SIZE = 256
+# Batches in flight per worker process.
+BATCH_WINDOW = 2
+
+_END = object()
+# An input iterator may yield _PAUSE when it has nothing to hand out until
+# the caller has consumed more results (see iter_extracted_cached). The
+# pipelines stop reading ahead, finish what is in flight, then pass _PAUSE
+# on to their caller, and read on when asked for the next result.
+_PAUSE = object()
+
+
+class AdaptiveBatchSize:
+    """
+    Sizes batches from a moving average of the per-file time reported by
+    the workers. Starts at `initial`, so the first measurements come back
+    quickly; minimum == maximum gives a fixed batch size.
+    """
+
+    def __init__(self, jobs, initial=4, minimum=1, maximum=None):
+        self.jobs = jobs
+        self.minimum = minimum
+        self.maximum = maximum or MAX_BATCH_SIZE
+        self.size = max(self.minimum, min(self.maximum, initial))
+        self.per_file = None  # seconds
+
+    def record(self, files, seconds):
+        if not files:
+            return
+        sample = seconds / files
+        self.per_file = sample if self.per_file is None else 0.7 * self.per_file + 0.3 * sample
+        target = int(BATCH_TARGET_SECONDS / max(self.per_file, 1e-6))
+        self.size = max(self.minimum, min(self.maximum, target))
+
+    def next_size(self, remaining=None):
+        # Leave enough batches to go round every worker's window, once the
+        # number of files remaining is known.
+        if remaining is None:
+            return self.size
+        share = -(-remaining // (self.jobs * BATCH_WINDOW))
+        return max(self.minimum, min(self.size, share))
+
+
+def _batched_map(executor, fn, items, sizer, window):
+    """
+    Submit items to fn in batches sized by sizer, with at most `window`
+    batches in flight. fn(batch) returns (results, seconds, extra); yields
+    (results, extra) per batch, in order, after reporting the batch's
+    seconds to sizer. items may be lazy: it is read only a window of batches
+    ahead of what has been submitted, which is also how far ahead the end
+    must be to split the last batches finer. items may pause (see _PAUSE).
+    """
+    items = iter(items)
+    ahead = deque()
+    exhausted = False
+    pending = deque()
+
+    def fill():
+        # Top up to `window` batches in flight; False if items paused.
+        nonlocal exhausted
+        paused = False
+        while len(pending) < window:
+            while not exhausted and not paused and len(ahead) < sizer.size * window:
+                item = next(items, _END)
+                if item is _END:
+                    exhausted = True
+                elif item is _PAUSE:
+                    paused = True
+                else:
+                    ahead.append(item)
+            size = sizer.next_size(len(ahead) if exhausted else None)
+            # While paused, a short batch waits for more items unless the
+            # workers would otherwise sit idle.
+            if not ahead or (paused and len(ahead) < size and pending):
+                break
+            batch = [ahead.popleft() for _ in range(min(size, len(ahead)))]
+            pending.append((len(batch), executor.submit(fn, batch)))
+        return not paused
+
+    while True:
+        if not pending and fill() and not pending:
+            return
+        if not pending:
+            yield _PAUSE
+            continue
+        count, future = pending.popleft()
+        results, seconds, extra = future.result()
+        sizer.record(count, seconds)
+        fill()
+        yield results, extra
+
+
+# ---------------------------------------------------------------------------
+# Staged pipeline (--read-threads): reader threads -> extractors -> caller
+#
+# Reads on network storage are latency-bound while parsing is CPU-bound, so
+# with read threads the files are read in a thread pool and the text chunks
+# handed to the extractors (this process, or a process pool with --jobs).
+# Each stage keeps a bounded window of calls in flight, so a slow consumer
+# (e.g. the output writer) stalls the stages before it instead of letting
+# their results pile up in memory.
+# ---------------------------------------------------------------------------
+
+# Calls in flight per reader thread / per worker process.
+PIPELINE_WINDOW = 4
+
+
+def _bounded_map(executor, fn, items, window):
+    """
+    Like executor.map, but with at most `window` calls in flight, and items
+    pulled from the (possibly lazy) iterable only as results are consumed.
+    Results are yielded in order. items may pause (see _PAUSE).
+    """
+    items = iter(items)
+    pending = deque()
+
+    def fill():
+        # Top up to `window` calls in flight; False if items paused.
+        while len(pending) < window:
+            item = next(items, _END)
+            if item is _END or item is _PAUSE:
+                return item is _END
+            pending.append(executor.submit(fn, item))
+        return True
+
+    while True:
+        if not pending and fill() and not pending:
+            return
+        if not pending:
+            yield _PAUSE
+            continue
+        result = pending.popleft().result()
+        fill()
+        yield result
+
+
+def _read_stage(path, collect_events):
+    # Runs in a reader thread; the events are replayed by the consumer.
+    events = EventLog() if collect_events else None
+    start = time.perf_counter()
+    meta, err = _read_png(path, events)
+    return meta, err, time.perf_counter() - start, events
+
+
+def _extract_read(read, memo, stats, method_order, plan_cache, json_backend, all_outputs):
+    """Extraction stage for (meta, read error, read seconds) from a reader thread."""
+    meta, err, read_seconds = read
+    start = time.perf_counter()
+    prompt = None
+    if meta is not None:
+        prompt, err = _extract_meta(meta, memo, stats, method_order or METHODS, plan_cache,
+                                    json_backend, all_outputs)
+    if stats is not None:
+        stats.record("time", "file", read_seconds + time.perf_counter() - start)
+    return prompt, err
+
+
+# Handing chunks to workers through shared memory (--shared-memory): the
+# reader side copies each file's chunk payloads into a free slot of a
+# SharedChunkRing and sends only a SharedChunks handle. The worker maps the
+# block and copies a payload out only when its chunk is consulted, so a memo
+# hit never copies at all. Files too large for a slot, or arriving while
+# every slot is in use, are pickled as before.
+
+SHM_SLOT_SIZE = 1024 * 1024
+
+SharedChunks = namedtuple("SharedChunks", "block chunks")  # chunks: (key, ctype, offset, size)
+
+
+class SharedChunkRing:
+    """Fixed-size slots in one shared memory block, reused as results come back."""
+
+    def __init__(self, slots, slot_size=None):
+        self.slot_size = slot_size or SHM_SLOT_SIZE
+        self.shm = SharedMemory(create=True, size=slots * self.slot_size)
+        self._free = deque(range(slots))
+
+    def pack(self, meta):
+        """(slot, SharedChunks) for meta copied into a free slot, or (None, meta) if it can't be."""
+        if not isinstance(meta, PngTextChunks) or not self._free:
+            return None, meta
+        payloads = meta.payloads()
+        if sum(len(payload) for _, _, payload in payloads) > self.slot_size:
+            return None, meta
+        slot = self._free.popleft()
+        offset = slot * self.slot_size
+        chunks = []
+        for key, ctype, payload in payloads:
+            self.shm.buf[offset:offset + len(payload)] = payload
+            chunks.append((key, ctype, offset, len(payload)))
+            offset += len(payload)
+        return slot, SharedChunks(self.shm.name, tuple(chunks))
+
+    def release(self, slot):
+        if slot is not None:
+            self._free.append(slot)
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _attach_chunks(shared):
+    shm = _worker_shared.get(shared.block)
+    if shm is None:
+        try:
+            # Workers share the parent's resource tracker, which unlinks the
+            # block; 3.13+ can skip registering it again.
+            shm = SharedMemory(name=shared.block, track=False)
+        except TypeError:
+            shm = SharedMemory(name=shared.block)
+        _worker_shared[shared.block] = shm
+    return PngTextChunks.from_payloads(
+        (key, ctype, shm.buf[offset:offset + size]) for key, ctype, offset, size in shared.chunks)
+
+
+def _pack_shared(reads, ring, slots, stats):
+    # Slots are queued in task order and released as results come back.
+    for read in reads:
+        if read is _PAUSE:
+            yield _PAUSE
+            continue
+        meta, err, seconds = read
+        slot = None
+        if meta is not None:
+            slot, meta = ring.pack(meta)
+            if stats is not None:
+                stats.record("count", "shm_handoff" if slot is not None else "shm_pickled", 1)
+        slots.append(slot)
+        yield meta, err, seconds
+
+
+def _paths_noting_names(files, names):
+    # Paths of (name, path, ...) entries, read lazily; their names queue up
+    # in `names` for matching with the results, which come back in order.
+    for entry in files:
+        if entry is _PAUSE:
+            yield _PAUSE
+            continue
+        name, path, *_ = entry
+        names.append(name)
+        yield path
+
+
+def _iter_extracted_staged(files, jobs, read_threads, memo_size, stats, method_order,
+                           json_backend, all_outputs, shared_memory=False,
+                           executor="processes"):
+    names = deque()
+    ring = None
+
+    def reads(results):
+        for result in results:
+            if result is _PAUSE:
+                yield _PAUSE
+                continue
+            meta, err, seconds, events = result
+            if events:
+                stats.replay(events)
+            yield meta, err, seconds
+
+    def extract_here(staged, *args):
+        for read in staged:
+            yield read if read is _PAUSE else _extract_read(read, *args) + (None,)
+
+    with ExitStack() as stack:
+        readers = stack.enter_context(ThreadPoolExecutor(read_threads))
+        read = partial(_read_stage, collect_events=stats is not None)
+        staged = reads(_bounded_map(readers, read, _paths_noting_names(files, names),
+                                    read_threads * PIPELINE_WINDOW))
+        if jobs <= 1:
+            memo = ResultMemo(memo_size) if memo_size else None
+            plan_cache = TopologyPlanCache(memo_size) if memo_size else None
+            backend = get_json_backend(json_backend)
+            results = extract_here(staged, memo, stats, method_order, plan_cache, backend,
+                                   all_outputs)
+        else:
+            window = jobs * PIPELINE_WINDOW
+            # Threads share this process's memory; only processes need it.
+            if shared_memory and executor == "processes":
+                # One slot per call in flight, plus the one whose result is
+                # being consumed when the next call is submitted.
+                ring = SharedChunkRing(window + 1)
+                stack.callback(ring.close)
+                slots = deque()
+                staged = _pack_shared(staged, ring, slots, stats)
+            pool, _, extract_read = _extractor_pool(stack, executor, jobs, memo_size, stats,
+                                                    method_order, json_backend, all_outputs)
+            results = _bounded_map(pool, extract_read, staged, window)
+        for result in results:
+            if result is _PAUSE:
+                yield _PAUSE
+                continue
+            prompt, err, events = result
+            if ring is not None:
+                ring.release(slots.popleft())
+            if events:
+                stats.replay(events)
+            yield names.popleft(), prompt, err
+
+
+def iter_extracted(files, jobs=1, memo_size=DEFAULT_MEMO_SIZE, stats=None, method_order=None,
+                   json_backend="auto", all_outputs=False, read_threads=0,
+                   shared_memory=False, batch_size=None, executor=None):
+    """
+    Yield (name, prompt, error) for each (name, path, ...) in files, in input order.
+    With jobs > 1 the extraction runs in a pool of `executor` workers, "threads"
+    or "processes" (default: default_executor()), batch_size files per task
+    (default: tuned as it goes, see Batched dispatch); results are still
+    yielded in the order the files were given. memo_size bounds the chunk
+    result memo and the topology plan cache (per worker process, or shared by
+    the threads); 0 disables them. stats receives the
+    extraction events, including those recorded in worker processes.
+    method_order is as for extract_final_positive_prompt_from_png; an
+    AdaptiveMethodOrder is copied into each worker process and adapts
+    independently, or is shared by the threads.
+    json_backend names the JSON parser (see get_json_backend). With
+    all_outputs, prompt is the list from extract_all_positive_prompts_from_png.
+    read_threads > 0 reads the files in that many threads of this process
+    and hands their metadata to the extractors (see Staged pipeline), through
+    shared memory if shared_memory and jobs > 1 with processes. The staged
+    pipeline hands over one file per task, so batch_size can't be combined
+    with read_threads (ValueError).
+    """
+    executor = executor or default_executor()
+    if read_threads > 0 and batch_size:
+        raise ValueError("batch_size does not apply with read_threads")
+    if read_threads > 0:
+        yield from _iter_extracted_staged(files, jobs, read_threads, memo_size, stats,
+                                          method_order, json_backend, all_outputs,
+                                          shared_memory, executor)
+        return
+    if jobs <= 1:
+        memo = ResultMemo(memo_size) if memo_size else None
+        plan_cache = TopologyPlanCache(memo_size) if memo_size else None
+        backend = get_json_backend(json_backend)
+        extract = (extract_all_positive_prompts_from_png if all_outputs
+                   else extract_final_positive_prompt_from_png)
+        for entry in files:
+            if entry is _PAUSE:
+                yield _PAUSE
+                continue
+            name, path, *_ = entry
+            prompt, err = extract(
+                path, memo=memo, stats=stats, method_order=method_order, plan_cache=plan_cache,
+                json_backend=backend)
+            yield name, prompt, err
+        return
+
+    sizer = (AdaptiveBatchSize(jobs) if not batch_size
+             else AdaptiveBatchSize(jobs, batch_size, batch_size, batch_size))
+    names = deque()
+    with ExitStack() as stack:
+        pool, extract_batch, _ = _extractor_pool(stack, executor, jobs, memo_size, stats,
+                                                 method_order, json_backend, all_outputs)
+        batches = _batched_map(pool, extract_batch, _paths_noting_names(files, names),
+                               sizer, jobs * BATCH_WINDOW)
+        for batch in batches:
+            if batch is _PAUSE:
+                yield _PAUSE
+                continue
+            results, events = batch
+            if events:
+                stats.replay(events)
+            if stats is not None:
+                stats.record("count", "batches", 1)
+            for prompt, err in results:
+                yield names.popleft(), prompt, err
+
+
+# ---------------------------------------------------------------------------
+# Checkpoints (--resume)
+#
+# Files are processed in a deterministic order, so a run's progress is the
+# name of the last file it finished. Every CHECKPOINT_INTERVAL seconds, at a
+# file boundary, the outputs' .part files are synced and their sizes written
+# to "<first output>.checkpoint" along with that name. A resumed run cuts
+# each .part file back to its checkpointed size, dropping rows written after
+# the checkpoint, skips the files up to and including that name and appends.
+# The checkpoint is removed when the run completes.
+# ---------------------------------------------------------------------------
+
+CHECKPOINT_INTERVAL = 30.0  # seconds
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+
+def write_checkpoint(path, run, writers, files, last, extracted, skipped):
+    """Sync the writers and atomically record the run's progress at path."""
+    state = dict(run, offsets=[w.sync() for w in writers], files=files, last=last,
+                 extracted=extracted, skipped=skipped)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+
+def load_checkpoint(path):
+    """The checkpoint at path as a dict, or None if there is none."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class ResumeError(Exception):
+    """A checkpoint that cannot be resumed from the current input folder."""
+
+
+def _skip_through(files, last):
+    # Drop files up to and including `last` (by name), yield the rest.
+    files = iter(files)
+    for f in files:
+        if f.name == last:
+            break
     else:
-        for name in sorted(os.listdir(input_folder)):
-            if name.lower().endswith(".png"):
-                yield name, os.path.join(input_folder, name)
+        raise ResumeError(f"{last} is no longer in the input folder")
+    yield from files
 
 
-def main(argv=None):
+def main(argv=None, hooks=()):
+    """
+    Command-line entry point. hooks: callables receiving every extraction
+    event as hook(kind, name, value); see ExtractionStats.
+    """
     parser = argparse.ArgumentParser(
         description="Extract the final positive prompt from ComfyUI/A1111 PNG images."
     )
@@ -498,33 +2403,207 @@ def main(argv=None):
                         help="Output file (default: prompts.txt, or prompts.csv with --csv)")
     parser.add_argument("--csv", action="store_true",
                         help="Write CSV (filename,prompt) instead of plain text")
+    parser.add_argument("-o", "--out", action="append", default=[], metavar="PATH",
+                        help="Additional output file; repeat to write several formats in one "
+                             "pass. Format follows the extension: .txt, .csv or .jsonl")
     parser.add_argument("-r", "--recursive", action="store_true",
                         help="Scan subfolders too")
+    parser.add_argument("--scan-threads", type=int, default=DEFAULT_SCAN_THREADS, metavar="N",
+                        help=f"Threads used to list subfolders with --recursive "
+                             f"(default: {DEFAULT_SCAN_THREADS})")
+    parser.add_argument("-j", "--jobs", type=int, nargs="?", const=0, default=1,
+                        help="Extract in N workers (--jobs alone: one per CPU)")
+    parser.add_argument("--executor", choices=("auto",) + EXECUTORS, default="auto",
+                        help="Worker kind for --jobs (default: auto, threads on a "
+                             "free-threaded Python build, processes otherwise)")
+    parser.add_argument("--batch-size", type=int, default=None, metavar="N",
+                        help="Files per worker task with --jobs, not with --read-threads "
+                             "(default: tuned from the time each file takes)")
+    parser.add_argument("--read-threads", type=int, default=0, metavar="N",
+                        help="Read files in N threads and pass their metadata to the "
+                             "extractors; helps when reads are slow, e.g. network storage "
+                             "(default: 0, each extractor reads its own files)")
+    parser.add_argument("--shared-memory", action="store_true",
+                        help="With --read-threads and --jobs, hand file metadata to the "
+                             "workers through shared memory instead of pickling it")
+    parser.add_argument("--cache", metavar="PATH", default=None,
+                        help=f"Result cache for incremental re-runs "
+                             f"(default: {DEFAULT_CACHE_NAME} next to the output file)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Neither read nor write the result cache")
+    parser.add_argument("--rebuild-cache", action="store_true",
+                        help="Discard cached results and extract every file again")
+    parser.add_argument("--memo-size", type=int, default=DEFAULT_MEMO_SIZE, metavar="N",
+                        help=f"Remember results for the last N distinct workflow/prompt "
+                             f"chunks and traversal paths for the last N graph topologies "
+                             f"(default: {DEFAULT_MEMO_SIZE}; 0 disables)")
+    parser.add_argument("--method-order", type=parse_method_order, default=METHODS,
+                        metavar="ORDER",
+                        help="Metadata sources to try, comma-separated, e.g. "
+                             "'prompt,workflow,parameters' (default: "
+                             f"{','.join(METHODS)}), or 'auto' to try the most "
+                             "successful source first as the run goes")
+    parser.add_argument("--all-outputs", action="store_true",
+                        help="One row per save node instead of one per image; CSV and "
+                             "JSONL outputs get an 'output' column with the node id")
+    parser.add_argument("--save-node-type", action="append", default=[], metavar="TYPE",
+                        help="Also treat node types containing TYPE as save nodes, e.g. "
+                             "SaveAnimatedWEBP or VHS_VideoCombine; repeat for several")
+    parser.add_argument("--json-backend", choices=("auto", "json", "orjson"), default="auto",
+                        help="Parser for workflow/prompt chunks (default: auto, which uses "
+                             "orjson when installed)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run from its checkpoint, appending to "
+                             "its .part output files")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print per-stage timings and per-method outcome counts")
+    parser.add_argument("--stats-json", metavar="PATH", default=None,
+                        help="Write the same statistics as JSON to PATH")
     args = parser.parse_args(argv)
 
-    output_file = args.output_file or ("prompts.csv" if args.csv else "prompts.txt")
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    executor = default_executor() if args.executor == "auto" else args.executor
+    if args.batch_size is not None and args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.batch_size is not None and args.read_threads > 0:
+        parser.error("--batch-size does not apply with --read-threads")
+    for marker in args.save_node_type:
+        register_save_node_type(marker)
+    try:
+        get_json_backend(args.json_backend)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # (path, writer class); --csv applies to the positional/default output only
+    outputs = [(path, writer_for_path(path)) for path in args.out]
+    if args.output_file or not outputs:
+        output_file = args.output_file or ("prompts.csv" if args.csv else "prompts.txt")
+        outputs.insert(0, (output_file, writer_for_path(output_file, force_csv=args.csv)))
 
     if not os.path.isdir(args.input_folder):
         print(f"ERROR: not a folder: {args.input_folder}")
         return 1
 
-    results = []
+    checkpoint_path = outputs[0][0] + CHECKPOINT_SUFFIX
+    run = {"input_folder": os.path.abspath(args.input_folder), "recursive": args.recursive,
+           "all_outputs": args.all_outputs, "outputs": [path for path, _ in outputs]}
+    checkpoint = load_checkpoint(checkpoint_path) if args.resume else None
+    if args.resume and checkpoint is None:
+        print(f"No checkpoint at {checkpoint_path}; starting from the beginning")
+    if checkpoint and any(checkpoint.get(k) != v for k, v in run.items()):
+        parser.error(f"{checkpoint_path} is from a run with a different input folder, "
+                     f"outputs or --all-outputs")
+    if checkpoint:
+        missing = [path + ".part" for path in run["outputs"] if not os.path.exists(path + ".part")]
+        if missing:
+            print(f"ERROR: cannot resume from {checkpoint_path}: missing {', '.join(missing)}")
+            return 1
+        # A .part file shorter than its checkpointed size was rewritten since.
+        short = [path + ".part" for path, size in zip(checkpoint["outputs"], checkpoint["offsets"])
+                 if os.path.getsize(path + ".part") < size]
+        if short:
+            print(f"ERROR: cannot resume from {checkpoint_path}: {', '.join(short)} "
+                  f"changed since the checkpoint")
+            return 1
+    elif os.path.exists(checkpoint_path):
+        # This run rewrites the .part files, so the old checkpoint no longer fits them.
+        os.remove(checkpoint_path)
+
+    cache = None
+    if not args.no_cache:
+        cache_path = args.cache or os.path.join(
+            os.path.dirname(os.path.abspath(outputs[0][0])), DEFAULT_CACHE_NAME)
+        try:
+            order = args.method_order
+            settings = "auto" if isinstance(order, AdaptiveMethodOrder) else ",".join(order)
+            settings = f"method-order={settings}"
+            if args.save_node_type:
+                settings += f";save-node-types={','.join(sorted(args.save_node_type))}"
+            if args.all_outputs:
+                settings += ";all-outputs"
+            cache = ExtractionCache(cache_path, rebuild=args.rebuild_cache, settings=settings)
+        except sqlite3.Error as e:
+            print(f"WARNING: cache disabled ({cache_path}: {e})")
+
+    stats = None
+    if args.profile or args.stats_json or hooks:
+        stats = ExtractionStats(hooks)
+
+    extracted_count = 0
     skipped = 0
-    for name, path in iter_png_files(args.input_folder, recursive=args.recursive):
-        prompt, err = extract_final_positive_prompt_from_png(path)
-        if prompt:
-            results.append((name, prompt))
+    files_done = 0
+    last = None
+    offsets = {}
+    files = scan_png_files(args.input_folder, recursive=args.recursive,
+                           threads=args.scan_threads)
+    if checkpoint:
+        extracted_count, skipped = checkpoint["extracted"], checkpoint["skipped"]
+        files_done, last = checkpoint["files"], checkpoint["last"]
+        offsets = dict(zip(checkpoint["outputs"], checkpoint["offsets"]))
+        if last is not None:
+            files = _skip_through(files, last)
+        print(f"Resuming after {files_done} files (last: {last})")
+    try:
+        if cache:
+            extracted = iter_extracted_cached(files, cache, jobs=jobs, memo_size=args.memo_size,
+                                              stats=stats, method_order=args.method_order,
+                                              json_backend=args.json_backend,
+                                              all_outputs=args.all_outputs,
+                                              read_threads=args.read_threads,
+                                              shared_memory=args.shared_memory,
+                                              batch_size=args.batch_size,
+                                              executor=executor)
         else:
-            skipped += 1
-            # Be explicit in the console; skip bad files silently in outputs.
-            print(f"[skip] {name}: {err}")
-
-    if args.csv or output_file.lower().endswith(".csv"):
-        write_csv(output_file, results)
-    else:
-        write_txt(output_file, results)
-
-    print(f"Extracted {len(results)} prompts ({skipped} skipped) -> {output_file}")
+            extracted = iter_extracted(files, jobs=jobs, memo_size=args.memo_size,
+                                       stats=stats, method_order=args.method_order,
+                                       json_backend=args.json_backend,
+                                       all_outputs=args.all_outputs,
+                                       read_threads=args.read_threads,
+                                       shared_memory=args.shared_memory,
+                                       batch_size=args.batch_size,
+                                       executor=executor)
+        with ExitStack() as stack:
+            writers = [stack.enter_context(cls(path, with_output=args.all_outputs,
+                                               resume_offset=offsets.get(path)))
+                       for path, cls in outputs]
+            next_checkpoint = time.monotonic() + CHECKPOINT_INTERVAL
+            for name, prompt, err in extracted:
+                if prompt:
+                    rows = prompt if args.all_outputs else [(None, prompt)]
+                    for output, text in rows:
+                        extracted_count += 1
+                        output = None if output is None else str(output)
+                        for writer in writers:
+                            writer.write(name, text, output)
+                else:
+                    skipped += 1
+                    # Be explicit in the console; skip bad files silently in outputs.
+                    print(f"[skip] {name}: {err}")
+                files_done += 1
+                last = name
+                if time.monotonic() >= next_checkpoint:
+                    write_checkpoint(checkpoint_path, run, writers, files_done, last,
+                                     extracted_count, skipped)
+                    next_checkpoint = time.monotonic() + CHECKPOINT_INTERVAL
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+    except ResumeError as e:
+        # The checkpoint's last file is gone, so the files after it are unknown.
+        print(f"ERROR: cannot resume from {checkpoint_path}: {e}")
+        return 1
+    finally:
+        if cache:
+            cache.close()
+
+    print(f"Extracted {extracted_count} prompts ({skipped} skipped) -> "
+          f"{', '.join(path for path, _ in outputs)}")
+    if cache and cache.hits:
+        print(f"Reused {cache.hits} unchanged results from {cache.db_path}")
+    if args.profile:
+        print(stats.format_table())
+    if args.stats_json:
+        with open(args.stats_json, "w", encoding="utf-8") as f:
+            json.dump(stats.summary(), f, indent=2)
     return 0
 
 
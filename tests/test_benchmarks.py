@@ -0,0 +1,29 @@
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks import run  # noqa: E402
+from benchmarks.corpus import generate_corpus  # noqa: E402
+from extract_prompts import extract_final_positive_prompt_from_png  # noqa: E402
+
+
+def test_corpus_is_reproducible_and_extractable(tmp_path):
+    kwargs = dict(images=6, nodes=30, chain_depth=4, compress=True, batch_size=2, seed=7)
+    generate_corpus(str(tmp_path / "a"), **kwargs)
+    generate_corpus(str(tmp_path / "b"), **kwargs)
+    for png in sorted((tmp_path / "a").iterdir()):
+        assert png.read_bytes() == (tmp_path / "b" / png.name).read_bytes()
+        prompt, err = extract_final_positive_prompt_from_png(str(png))
+        assert err is None and prompt
+
+
+def test_benchmark_run_reports_every_stage(tmp_path):
+    out = tmp_path / "results.json"
+    assert run.main(["--images", "5", "--nodes", "20", "--json", str(out)]) == 0
+    report = json.loads(out.read_text(encoding="utf-8"))
+    assert report["corpus"]["images"] == 5
+    assert {"walk", "chunk_read", "json_parse_workflow", "extract_prompt",
+            "end_to_end", "write_csv"} <= set(report["stages"])
+    assert report["stages"]["end_to_end"]["succeeded"] == 5
@@ -2,17 +2,38 @@ import csv
 import json
 import subprocess
 import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import pytest
 from PIL import Image, PngImagePlugin
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
+import extract_prompts
 from extract_prompts import (
+    AdaptiveMethodOrder,
+    ExtractionStats,
+    ResultMemo,
+    TopologyPlanCache,
+    TxtWriter,
+    WorkflowGraph,
+    extract_all_from_api_prompt,
+    extract_all_from_workflow,
+    extract_all_positive_prompts_from_png,
     extract_final_positive_prompt_from_png,
     extract_from_api_prompt,
     extract_from_parameters,
     extract_from_workflow,
+    get_json_backend,
+    iter_extracted,
+    main,
+    parse_method_order,
+    read_png_text_chunks,
+    scan_png_files,
     write_csv,
     write_txt,
 )
@@ -137,6 +158,248 @@ def test_workflow_dangling_link_id_no_crash():
     assert err == "no-start-from-saveimage"
 
 
+def test_workflow_graph_index():
+    graph = WorkflowGraph(SAMPLE_WORKFLOW)
+    sampler = graph.node(4)
+    assert sampler["type"] == "KSampler"
+    assert graph.node(None) is None
+    assert graph.node(99) is None
+    assert [(inp["name"], src) for inp, src in graph.input_links(sampler)] == [
+        ("positive", 3), ("negative", 7)]
+
+
+def test_workflow_prebuilt_graph_is_reused():
+    graph = WorkflowGraph(SAMPLE_WORKFLOW)
+    prompt, err = extract_from_workflow(SAMPLE_WORKFLOW, graph)
+    assert err is None
+    assert prompt == "a beautiful sunset over mountains"
+    assert [n["id"] for _, n in graph.nodes_by_type["CLIPTextEncode"]] == [3, 7]
+
+
+def test_workflow_topology_plan_cache():
+    plans = TopologyPlanCache()
+    for text in ("first prompt", "second prompt"):
+        wf = json.loads(json.dumps(SAMPLE_WORKFLOW))
+        wf["nodes"][0]["widgets_values"] = [text]
+        wf["nodes"][2]["widgets_values"] = [12345, "randomize"]  # seed differs too
+        assert extract_from_workflow(wf, plan_cache=plans) == (text, None)
+    assert (plans.hits, plans.misses) == (1, 1)
+
+    # A structural change is a different topology.
+    wf = json.loads(json.dumps(SAMPLE_WORKFLOW))
+    wf["links"] = [rec for rec in wf["links"] if rec[0] != 4]
+    assert extract_from_workflow(wf, plan_cache=plans) == (None, "no-start-from-saveimage")
+    assert extract_from_workflow(wf, plan_cache=plans) == (None, "no-start-from-saveimage")
+    assert (plans.hits, plans.misses) == (2, 2)
+
+
+def test_api_topology_plan_cache_resolves_text_per_graph():
+    plans = TopologyPlanCache()
+    graph = json.loads(json.dumps(SAMPLE_API_PROMPT))
+    # A second pipeline whose save node is tried first (higher id).
+    graph["13"] = {"class_type": "CLIPTextEncode", "inputs": {"clip": ["1", 1], "text": ""}}
+    graph["14"] = {"class_type": "KSampler", "inputs": {"positive": ["13", 0]}}
+    graph["16"] = {"class_type": "SaveImage", "inputs": {"images": ["14", 0]}}
+    # Empty text on the first candidate falls through to the second one...
+    assert extract_from_api_prompt(graph, plan_cache=plans) == (
+        "a beautiful sunset over mountains", None)
+    # ...but with the same topology and text filled in, the first one wins.
+    graph["13"]["inputs"]["text"] = "hires prompt"
+    assert extract_from_api_prompt(graph, plan_cache=plans) == ("hires prompt", None)
+    assert (plans.hits, plans.misses) == (1, 1)
+
+
+def test_plan_cache_accepts_unhashable_graph_values():
+    # The walks tolerate lists where scalars are expected; the plan cache
+    # must not turn those graphs into errors.
+    wf = json.loads(json.dumps(SAMPLE_WORKFLOW))
+    wf["nodes"][3]["inputs"][1]["type"] = ["LATENT"]
+    wf["links"][0][5] = ["CONDITIONING"]
+    api = json.loads(json.dumps(SAMPLE_API_PROMPT))
+    api["9"] = {"class_type": "Note", "inputs": ["not", "a", "dict"]}
+    sunset = ("a beautiful sunset over mountains", None)
+    plans = TopologyPlanCache()
+    for _ in range(2):
+        assert extract_from_workflow(wf) == extract_from_workflow(wf, plan_cache=plans) == sunset
+        assert extract_from_api_prompt(api) == extract_from_api_prompt(api, plans) == sunset
+    assert (plans.hits, plans.misses) == (2, 2)
+
+
+def _string_chain_graphs(depth):
+    """Workflow and API graphs whose prompt passes through `depth` string nodes."""
+    nodes = [{"id": 1, "type": "PrimitiveStringMultiline", "inputs": [],
+              "widgets_values": ["a very long chain"]}]
+    links = []
+    api = {"1": {"class_type": "PrimitiveStringMultiline", "inputs": {"value": "a very long chain"}}}
+    for i in range(2, depth + 2):
+        nodes.append({"id": i, "type": "StringPassthrough",
+                      "inputs": [{"name": "string", "type": "STRING", "link": i}]})
+        links.append([i, i - 1, 0, i, 0, "STRING"])
+        api[str(i)] = {"class_type": "StringPassthrough", "inputs": {"string": [str(i - 1), 0]}}
+    clip, ksampler, save = depth + 2, depth + 3, depth + 4
+    nodes += [
+        {"id": clip, "type": "CLIPTextEncode",
+         "inputs": [{"name": "text", "type": "STRING", "link": clip}]},
+        {"id": ksampler, "type": "KSampler",
+         "inputs": [{"name": "positive", "type": "CONDITIONING", "link": ksampler}]},
+        {"id": save, "type": "SaveImage", "inputs": [{"name": "images", "type": "IMAGE", "link": save}]},
+    ]
+    links += [[clip, depth + 1, 0, clip, 0, "STRING"],
+              [ksampler, clip, 0, ksampler, 0, "CONDITIONING"],
+              [save, ksampler, 0, save, 0, "IMAGE"]]
+    api[str(clip)] = {"class_type": "CLIPTextEncode", "inputs": {"text": [str(depth + 1), 0]}}
+    api[str(ksampler)] = {"class_type": "KSampler", "inputs": {"positive": [str(clip), 0]}}
+    api[str(save)] = {"class_type": "SaveImage", "inputs": {"images": [str(ksampler), 0]}}
+    return {"nodes": nodes, "links": links}, api
+
+
+def test_deep_string_chains_resolve_without_recursion():
+    workflow, api = _string_chain_graphs(3 * sys.getrecursionlimit())
+    assert extract_from_workflow(workflow) == ("a very long chain", None)
+    assert extract_from_api_prompt(api) == ("a very long chain", None)
+
+
+def test_text_walk_gives_up_past_its_budget(monkeypatch):
+    workflow, api = _string_chain_graphs(50)
+    monkeypatch.setattr(extract_prompts, "MAX_TEXT_WALK_NODES", 20)
+    assert extract_from_workflow(workflow) == (None, "no-prompt-resolved")
+    assert extract_from_api_prompt(api) == (None, "no-prompt-resolved")
+
+
+def _two_output_graphs():
+    """SAMPLE_WORKFLOW/SAMPLE_API_PROMPT plus a second save node fed by its own CLIP."""
+    workflow = json.loads(json.dumps(SAMPLE_WORKFLOW))
+    workflow["nodes"] += [
+        {"id": 8, "type": "CLIPTextEncode", "order": 5,
+         "inputs": [{"name": "text", "type": "STRING", "link": None}],
+         "widgets_values": ["hires pass"]},
+        {"id": 9, "type": "KSampler", "order": 6,
+         "inputs": [{"name": "positive", "type": "CONDITIONING", "link": 5},
+                    {"name": "latent_image", "type": "LATENT", "link": 6}]},
+        {"id": 10, "type": "VAEDecode", "order": 7,
+         "inputs": [{"name": "samples", "type": "LATENT", "link": 7}]},
+        {"id": 11, "type": "SaveImage", "order": 8,
+         "inputs": [{"name": "images", "type": "IMAGE", "link": 8}]},
+        # a third output sharing the first sampler's upstream walk
+        {"id": 12, "type": "Image Save", "order": 9,
+         "inputs": [{"name": "images", "type": "IMAGE", "link": 9}]},
+    ]
+    workflow["links"] += [[5, 8, 0, 9, 0, "CONDITIONING"], [6, 4, 0, 9, 1, "LATENT"],
+                          [7, 9, 0, 10, 0, "LATENT"], [8, 10, 0, 11, 0, "IMAGE"],
+                          [9, 5, 0, 12, 0, "IMAGE"]]
+    api = json.loads(json.dumps(SAMPLE_API_PROMPT))
+    api["8"] = {"class_type": "CLIPTextEncode", "inputs": {"text": "hires pass"}}
+    api["9"] = {"class_type": "KSampler", "inputs": {"positive": ["8", 0], "latent_image": ["4", 0]}}
+    api["10"] = {"class_type": "VAEDecode", "inputs": {"samples": ["9", 0]}}
+    api["11"] = {"class_type": "SaveImage", "inputs": {"images": ["10", 0]}}
+    api["12"] = {"class_type": "Image Save", "inputs": {"images": ["5", 0]}}
+    return workflow, api
+
+
+def test_all_outputs_share_upstream_walks(monkeypatch):
+    # 20 save nodes, each behind its own ImageSharpen, over one 1000-node
+    # image chain below SAMPLE_WORKFLOW's VAEDecode.
+    workflow = json.loads(json.dumps(SAMPLE_WORKFLOW))
+    nodes, links = workflow["nodes"], workflow["links"]
+    nodes.pop()  # the SaveImage
+    links.pop()
+    prev = 5
+    for i in range(100, 1100):
+        links.append([i, prev, 0, i, 0, "IMAGE"])
+        nodes.append({"id": i, "type": "ImageScaleBy", "order": i,
+                      "inputs": [{"name": "image", "type": "IMAGE", "link": i}]})
+        prev = i
+    for i in range(2000, 2020):
+        links.append([i, prev, 0, i, 0, "IMAGE"])
+        links.append([i + 100, i, 0, i + 100, 0, "IMAGE"])
+        nodes.append({"id": i, "type": "ImageSharpen", "order": i,
+                      "inputs": [{"name": "image", "type": "IMAGE", "link": i}]})
+        nodes.append({"id": i + 100, "type": "SaveImage", "order": i + 100,
+                      "inputs": [{"name": "images", "type": "IMAGE", "link": i + 100}]})
+
+    calls = []
+    input_links = extract_prompts.WorkflowGraph.input_links
+    monkeypatch.setattr(extract_prompts.WorkflowGraph, "input_links",
+                        lambda self, node: calls.append(node) or input_links(self, node))
+    rows, err = extract_all_from_workflow(workflow)
+    assert err is None
+    assert rows == [(i, "a beautiful sunset over mountains") for i in range(2119, 2099, -1)]
+    assert len(calls) < 1100  # about one walk down the chain, not one per save node
+
+
+def test_all_outputs_one_prompt_per_save_node():
+    workflow, api = _two_output_graphs()
+    sunset = "a beautiful sunset over mountains"
+    assert extract_all_from_workflow(workflow) == (
+        [(12, sunset), (11, "hires pass"), (6, sunset)], None)
+    assert extract_all_from_api_prompt(api) == (
+        [("12", sunset), ("11", "hires pass"), ("6", sunset)], None)
+    # the single-output functions still return the first one
+    assert extract_from_workflow(workflow) == (sunset, None)
+    assert extract_from_api_prompt(api) == (sunset, None)
+
+    plans = TopologyPlanCache()
+    for _ in range(2):
+        assert extract_all_from_workflow(workflow, plan_cache=plans)[0][1] == (11, "hires pass")
+    assert plans.hits == 1
+    assert extract_all_from_workflow({"nodes": [], "links": []}) == (None, "no-saveimage")
+
+
+class _CountingGraph(dict):
+    lookups = 0
+
+    def get(self, key, default=None):
+        self.lookups += 1
+        return super().get(key, default)
+
+
+def test_api_failing_candidates_share_upstream_walks():
+    # 200 save nodes over one 500-node chain with no positive input anywhere,
+    # then one working pipeline with the lowest id (tried last).
+    graph = _CountingGraph({str(i): {"class_type": "ImageScaleBy", "inputs": {"image": [str(i - 1), 0]}}
+                            for i in range(1001, 1500)})
+    graph["1000"] = {"class_type": "LoadImage", "inputs": {"image": "x.png"}}
+    for i in range(2000, 2200):
+        graph[str(i)] = {"class_type": "SaveImage", "inputs": {"images": ["1499", 0]}}
+    graph.update({k: v for k, v in SAMPLE_API_PROMPT.items()})
+    assert extract_from_api_prompt(graph) == ("a beautiful sunset over mountains", None)
+    assert graph.lookups < 3 * len(graph)
+
+
+def _api_saves_over_chain(saves=100, chain=2000):
+    # SAMPLE_API_PROMPT's output run through a long image chain, saved by
+    # many SaveImage nodes that all succeed.
+    graph = _CountingGraph(SAMPLE_API_PROMPT)
+    graph["6"] = {"class_type": "ImageScaleBy", "inputs": {"image": ["5", 0]}}
+    prev = "6"
+    for i in range(3000, 3000 + chain):
+        graph[str(i)] = {"class_type": "ImageScaleBy", "inputs": {"image": [prev, 0]}}
+        prev = str(i)
+    for i in range(9000, 9000 + saves):
+        graph[str(i)] = {"class_type": "SaveImage", "inputs": {"images": [prev, 0]}}
+    return graph
+
+
+def test_api_stops_at_first_candidate_with_text():
+    for plan_cache in (None, TopologyPlanCache()):
+        graph = _api_saves_over_chain()
+        assert extract_from_api_prompt(graph, plan_cache) == (
+            "a beautiful sunset over mountains", None)
+        assert graph.lookups < 2100  # one walk down the chain, not one per save
+
+
+def test_api_succeeding_candidates_share_upstream_walks():
+    # Every save node finds the same positive source down one long chain:
+    # later candidates stop where the first one's path begins.
+    for plan_cache in (None, TopologyPlanCache()):
+        graph = _api_saves_over_chain()
+        rows, err = extract_all_from_api_prompt(graph, plan_cache)
+        assert err is None
+        assert rows == [(str(i), "a beautiful sunset over mountains")
+                        for i in range(9099, 8999, -1)]
+        assert graph.lookups < 2 * len(graph)
+
+
 def test_api_prompt_extraction():
     prompt, err = extract_from_api_prompt(SAMPLE_API_PROMPT)
     assert err is None
@@ -205,6 +468,159 @@ def test_png_no_metadata(tmp_path):
     assert err == "no-metadata"
 
 
+def test_png_chunk_reader_matches_pillow(tmp_path):
+    png = tmp_path / "chunks.png"
+    img = Image.new("RGB", (1, 1))
+    info = PngImagePlugin.PngInfo()
+    info.add_text("workflow", json.dumps(SAMPLE_WORKFLOW))
+    info.add_text("prompt", json.dumps(SAMPLE_API_PROMPT), zip=True)
+    info.add_itxt("parameters", "caf\u00e9 \u2014 " + SAMPLE_PARAMETERS, zip=True)
+    img.save(png, pnginfo=info)
+
+    meta = read_png_text_chunks(str(png))
+    with Image.open(png) as pil_img:
+        for key in ("workflow", "prompt", "parameters"):
+            assert meta[key] == pil_img.info[key]
+
+
+def test_png_chunks_decoded_lazily(tmp_path):
+    png = tmp_path / "lazy.png"
+    _make_png(png, {"workflow": json.dumps(SAMPLE_WORKFLOW)})
+    # Splice in a zTXt "prompt" chunk whose compressed data is garbage.
+    data = png.read_bytes()
+    idat = data.index(b"IDAT") - 4
+    payload = b"prompt\0\0not zlib data"
+    chunk = len(payload).to_bytes(4, "big") + b"zTXt" + payload + b"\0\0\0\0"
+    png.write_bytes(data[:idat] + chunk + data[idat:])
+
+    meta = read_png_text_chunks(str(png))
+    assert set(meta) == {"workflow", "prompt"}
+    # workflow succeeds, so the broken prompt chunk is never inflated
+    prompt, err = extract_final_positive_prompt_from_png(str(png))
+    assert err is None
+    assert prompt == "a beautiful sunset over mountains"
+    with pytest.raises(zlib.error):
+        meta["prompt"]
+
+
+def test_png_chunk_reader_rejects_non_png(tmp_path):
+    bogus = tmp_path / "bogus.png"
+    bogus.write_bytes(b"GIF89a not really a png")
+    with pytest.raises(ValueError):
+        read_png_text_chunks(str(bogus))
+    prompt, err = extract_final_positive_prompt_from_png(str(bogus))
+    assert prompt is None
+    assert err.startswith("error:")
+
+
+def test_png_memo_skips_identical_chunks(tmp_path):
+    chunks = {"workflow": json.dumps(SAMPLE_WORKFLOW), "prompt": json.dumps(SAMPLE_API_PROMPT)}
+    for name in ("a.png", "b.png"):
+        _make_png(tmp_path / name, chunks)
+    memo = ResultMemo(maxsize=8)
+    for name in ("a.png", "b.png"):
+        prompt, err = extract_final_positive_prompt_from_png(str(tmp_path / name), memo=memo)
+        assert prompt == "a beautiful sunset over mountains"
+    # workflow succeeds first, so the prompt chunk is never consulted
+    assert (memo.hits, memo.misses) == (1, 1)
+
+
+def test_png_prefilter_skips_hopeless_chunks(tmp_path):
+    preview_only = {"nodes": [{"id": 1, "type": "LoadImage", "inputs": []}], "links": []}
+    no_clip = json.loads(json.dumps(SAMPLE_WORKFLOW))
+    for node in no_clip["nodes"]:
+        node["type"] = node["type"].replace("CLIPTextEncode", "TextEncodeQwen")
+    _make_png(tmp_path / "a.png", {"workflow": json.dumps(preview_only),
+                                   "prompt": json.dumps(SAMPLE_API_PROMPT)})
+    _make_png(tmp_path / "b.png", {"workflow": json.dumps(no_clip)})
+    # an escaped marker can't be ruled out by the substring scan
+    _make_png(tmp_path / "c.png", {"workflow": json.dumps(SAMPLE_WORKFLOW).replace(
+        '"SaveImage"', '"\\u0053aveImage"')})
+
+    stats = ExtractionStats()
+    results = [extract_final_positive_prompt_from_png(str(tmp_path / name), stats=stats)
+               for name in ("a.png", "b.png", "c.png")]
+    assert results == [("a beautiful sunset over mountains", None),
+                       (None, "workflow:prefiltered:no-clip-encode"),
+                       ("a beautiful sunset over mountains", None)]
+    assert stats.counts == {"prefilter_skip:workflow": 2}
+    assert stats.times["json:workflow"]["count"] == 1
+
+    # Unparsed, a chunk without markers can't be told apart from bad JSON.
+    _make_png(tmp_path / "d.png", {"prompt": "[1, 2]", "workflow": '{"nodes": [{"id": 1'})
+    assert extract_final_positive_prompt_from_png(str(tmp_path / "d.png")) == (
+        None, "workflow:prefiltered:no-saveimage; prompt:prefiltered:no-saveimage")
+
+
+def test_json_backends_agree(tmp_path):
+    pytest.importorskip("orjson")
+    unicode_workflow = json.loads(json.dumps(SAMPLE_WORKFLOW))
+    unicode_workflow["nodes"][0]["widgets_values"] = ["caf\u00e9 at dusk"]
+    nan_workflow = json.loads(json.dumps(SAMPLE_WORKFLOW))
+    nan_workflow["nodes"][2]["widgets_values"] = [float("nan")]
+    # non-ASCII text is stored as iTXt; NaN is valid for json but not orjson
+    _make_png(tmp_path / "a.png", {"workflow": json.dumps(unicode_workflow, ensure_ascii=False)})
+    _make_png(tmp_path / "b.png", {"workflow": json.dumps(nan_workflow)})
+    _make_png(tmp_path / "c.png", {"workflow": "{not json", "prompt": json.dumps(SAMPLE_API_PROMPT)})
+
+    for name in ("json", "orjson"):
+        backend = get_json_backend(name)
+        results = [extract_final_positive_prompt_from_png(str(tmp_path / f), json_backend=backend)
+                   for f in ("a.png", "b.png", "c.png")]
+        assert results == [("caf\u00e9 at dusk", None),
+                           ("a beautiful sunset over mountains", None),
+                           ("a beautiful sunset over mountains", None)], name
+    with pytest.raises(ValueError):
+        get_json_backend("simdjson")
+
+
+def test_result_memo_evicts_least_recently_used():
+    memo = ResultMemo(maxsize=2)
+    calls = []
+
+    def compute(tag):
+        return lambda: calls.append(tag) or (tag, None)
+
+    for raw in ("a", "b", "a", "c", "b"):
+        memo.get_or_compute("prompt", raw, compute(raw))
+    # "b" was evicted when "c" arrived because "a" had been used more recently
+    assert calls == ["a", "b", "c", "b"]
+    assert (memo.hits, memo.misses) == (1, 4)
+
+
+def test_png_method_order(tmp_path):
+    png = tmp_path / "both.png"
+    _make_png(png, {"prompt": json.dumps(SAMPLE_API_PROMPT),
+                    "parameters": "the a1111 prompt\nSteps: 20, Sampler: Euler"})
+    prompt, _ = extract_final_positive_prompt_from_png(str(png))
+    assert prompt == "a beautiful sunset over mountains"
+    prompt, _ = extract_final_positive_prompt_from_png(
+        str(png), method_order=parse_method_order("parameters,prompt"))
+    assert prompt == "the a1111 prompt"
+    prompt, err = extract_final_positive_prompt_from_png(
+        str(png), method_order=parse_method_order("workflow"))
+    assert prompt is None and err == "no-metadata"
+    with pytest.raises(ValueError):
+        parse_method_order("workflow,bogus")
+
+
+def test_adaptive_method_order_promotes_successful_method(tmp_path):
+    png = tmp_path / "subgraph.png"
+    _make_png(png, {"workflow": json.dumps({"nodes": [], "links": []}),
+                    "prompt": json.dumps(SAMPLE_API_PROMPT)})
+    order = parse_method_order("auto")
+    assert isinstance(order, AdaptiveMethodOrder)
+    assert order.order() == ("workflow", "prompt", "parameters")
+
+    _, err = extract_final_positive_prompt_from_png(str(png), method_order=order)
+    assert err is None
+    # workflow failed once and prompt succeeded: prompt is now tried first
+    assert order.order() == ("prompt", "parameters", "workflow")
+    _, err = extract_final_positive_prompt_from_png(str(png), method_order=order)
+    assert err is None
+    assert order.attempts == {"workflow": 1, "prompt": 2, "parameters": 0}
+
+
 def test_write_csv_sanitizes_formula_injection(tmp_path):
     out = tmp_path / "out.csv"
     write_csv(str(out), [("=cmd|' /C calc'!A0.png", "+SUM(1,1) prompt")])
@@ -220,6 +636,62 @@ def test_write_txt_flattens_newlines(tmp_path):
     assert out.read_text(encoding="utf-8") == "line one line two line three\n"
 
 
+def test_stream_writer_keeps_partial_output_on_failure(tmp_path):
+    out = tmp_path / "out.txt"
+    with pytest.raises(RuntimeError):
+        with TxtWriter(str(out)) as w:
+            w.write("a.png", "first prompt")
+            raise RuntimeError("crashed mid-run")
+    assert not out.exists()
+    assert (tmp_path / "out.txt.part").read_text(encoding="utf-8") == "first prompt\n"
+
+    with TxtWriter(str(out)) as w:
+        w.write("a.png", "first prompt")
+    assert out.read_text(encoding="utf-8") == "first prompt\n"
+    assert not (tmp_path / "out.txt.part").exists()
+
+
+def test_scan_png_files_sorted_depth_first(tmp_path):
+    for rel in ("b.png", "a.png", "notes.txt", "z/2.png", "z/1.PNG", "c/deep/x.png", "c/y.png"):
+        path = tmp_path / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"data")
+    expected = ["a.png", "b.png", "c/y.png", "c/deep/x.png", "z/1.PNG", "z/2.png"]
+
+    for threads in (1, 4):
+        files = list(scan_png_files(str(tmp_path), recursive=True, threads=threads))
+        assert [f.name.replace("\\", "/") for f in files] == expected
+        assert all(f.size == 4 and f.mtime_ns for f in files)
+
+    top = list(scan_png_files(str(tmp_path)))
+    assert [f.name for f in top] == ["a.png", "b.png"]
+
+
+def test_threaded_scan_stays_a_window_ahead(tmp_path, monkeypatch):
+    for i in range(6):
+        for j in range(5):
+            path = tmp_path / f"d{i}" / f"e{j}" / "x.png"
+            path.parent.mkdir(parents=True)
+            path.write_bytes(b"data")
+    expected = [f.name for f in scan_png_files(str(tmp_path), recursive=True, threads=1)]
+
+    monkeypatch.setattr(extract_prompts, "SCAN_WINDOW", 2)
+    scanned = []
+    scan_dir = extract_prompts._scan_dir
+
+    def counting_scan_dir(path, rel):
+        scanned.append(rel)
+        return scan_dir(path, rel)
+    monkeypatch.setattr(extract_prompts, "_scan_dir", counting_scan_dir)
+    files = scan_png_files(str(tmp_path), recursive=True, threads=2)
+    names = [next(files).name]
+    # The root, d0 and d0/e0 are consumed; at most 4 more are listed ahead.
+    assert len(scanned) <= 3 + 4
+    names += [f.name for f in files]
+    assert names == expected
+    assert len(scanned) == 1 + 6 + 30
+
+
 def test_cli_end_to_end(tmp_path):
     png_dir = tmp_path / "images"
     png_dir.mkdir()
@@ -270,3 +742,518 @@ def test_cli_bad_folder():
     )
     assert proc.returncode == 1
     assert "not a folder" in proc.stdout
+
+
+@pytest.mark.parametrize("executor", ["processes", "threads"])
+def test_cli_parallel_jobs_preserve_order(tmp_path, executor):
+    png_dir = tmp_path / "images"
+    png_dir.mkdir()
+    for i in range(6):
+        graph = json.loads(json.dumps(SAMPLE_API_PROMPT))
+        graph["3"]["inputs"]["text"] = f"prompt {i}"
+        _make_png(png_dir / f"img_{i}.png", {"prompt": json.dumps(graph)})
+
+    csv_out = tmp_path / "result.csv"
+    subprocess.run(
+        [sys.executable, str(MODULE_PATH), str(png_dir), str(csv_out), "--csv", "--jobs", "2",
+         "--executor", executor],
+        check=True, capture_output=True, text=True,
+    )
+    with open(csv_out, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows[1:] == [[f"img_{i}.png", f"prompt {i}"] for i in range(6)]
+
+
+def test_cli_save_node_type_reaches_workers(tmp_path):
+    png_dir = tmp_path / "images"
+    png_dir.mkdir()
+    for i in range(4):
+        workflow = json.loads(json.dumps(SAMPLE_WORKFLOW))
+        workflow["nodes"][0]["widgets_values"] = [f"prompt {i}"]
+        workflow["nodes"][4]["type"] = "SaveAnimatedWEBP"
+        graph = json.loads(json.dumps(SAMPLE_API_PROMPT))
+        graph["3"]["inputs"]["text"] = f"prompt {i}"
+        graph["6"]["class_type"] = "SaveAnimatedWEBP"
+        chunks = {"workflow": json.dumps(workflow)} if i % 2 else {"prompt": json.dumps(graph)}
+        _make_png(png_dir / f"img_{i}.png", chunks)
+
+    out = tmp_path / "out.txt"
+    cmd = [sys.executable, str(MODULE_PATH), str(png_dir), str(out), "--jobs", "2"]
+    proc = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    assert "Extracted 0 prompts (4 skipped)" in proc.stdout
+    proc = subprocess.run(cmd + ["--save-node-type", "SaveAnimatedWEBP"],
+                          check=True, capture_output=True, text=True)
+    assert "Extracted 4 prompts (0 skipped)" in proc.stdout
+    assert out.read_text(encoding="utf-8").splitlines() == [f"prompt {i}" for i in range(4)]
+
+
+def test_save_markers_take_precedence_within_a_type():
+    graph = json.loads(json.dumps(SAMPLE_API_PROMPT))
+    graph["8"] = {"class_type": "PreviewImage", "inputs": {"images": ["9", 0]}}
+    graph["9"] = {"class_type": "KSampler", "inputs": {"positive": ["10", 0]}}
+    graph["10"] = {"class_type": "CLIPTextEncode", "inputs": {"text": "preview"}}
+    graph["6"]["class_type"] = "PreviewImage|SaveImage"
+    assert extract_from_api_prompt(graph) == ("a beautiful sunset over mountains", None)
+    # "PreviewImage Save" overlaps the save marker "Image Save".
+    graph["6"]["class_type"] = "PreviewImage Save"
+    assert extract_prompts._node_type_rank("PreviewImage Save") == 0
+    assert extract_from_api_prompt(graph) == ("a beautiful sunset over mountains", None)
+
+
+def test_cli_all_outputs(tmp_path):
+    png_dir = tmp_path / "images"
+    png_dir.mkdir()
+    workflow, api = _two_output_graphs()
+    _make_png(png_dir / "a.png", {"workflow": json.dumps(workflow)})
+    _make_png(png_dir / "b.png", {"prompt": json.dumps(api)})
+    _make_png(png_dir / "c.png", {"parameters": SAMPLE_PARAMETERS})
+    assert extract_all_positive_prompts_from_png(str(png_dir / "c.png")) == (
+        [(None, "a beautiful sunset over mountains")], None)
+
+    csv_out = tmp_path / "all.csv"
+    cmd = [sys.executable, str(MODULE_PATH), str(png_dir), str(csv_out), "--csv", "--all-outputs"]
+    expected = [["filename", "output", "prompt"],
+                ["a.png", "12", "a beautiful sunset over mountains"],
+                ["a.png", "11", "hires pass"],
+                ["a.png", "6", "a beautiful sunset over mountains"],
+                ["b.png", "12", "a beautiful sunset over mountains"],
+                ["b.png", "11", "hires pass"],
+                ["b.png", "6", "a beautiful sunset over mountains"],
+                ["c.png", "", "a beautiful sunset over mountains"]]
+    for run in range(2):  # the second run is served from the cache
+        proc = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        assert "Extracted 7 prompts (0 skipped)" in proc.stdout
+        with open(csv_out, newline="", encoding="utf-8") as f:
+            assert list(csv.reader(f)) == expected
+    assert "Reused 3 unchanged results" in proc.stdout
+
+
+def test_bounded_map_limits_work_in_flight():
+    lock = threading.Lock()
+    running = [0, 0]  # current, max
+    pulled = []
+
+    def items():
+        for i in range(20):
+            pulled.append(i)
+            yield i
+
+    def work(i):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.002)
+        with lock:
+            running[0] -= 1
+        return i * i
+
+    with ThreadPoolExecutor(8) as pool:
+        results = extract_prompts._bounded_map(pool, work, items(), 3)
+        assert next(results) == 0
+        assert len(pulled) == 4  # the window, refilled once
+        assert list(results) == [i * i for i in range(1, 20)]
+    assert running[1] <= 3
+
+
+def test_batched_map_preserves_order_and_adapts_batch_size():
+    sizer = extract_prompts.AdaptiveBatchSize(jobs=2, initial=2)
+    sizes = []
+
+    def work(batch):
+        sizes.append(len(batch))
+        # 0.5 ms per file -> 100-file batches for a 50 ms target
+        return [i * i for i in batch], 0.0005 * len(batch), None
+
+    with ThreadPoolExecutor(2) as pool:
+        batches = extract_prompts._batched_map(pool, work, range(1000), sizer, 4)
+        results = [r for batch, _ in batches for r in batch]
+    assert results == [i * i for i in range(1000)]
+    assert sizes[:4] == [2, 2, 2, 2]
+    assert max(sizes) == 100
+    # The tail is split finer than the tuned size so workers finish together.
+    assert sizes[-1] < 100
+
+
+def test_fixed_batch_size_and_tail_split():
+    fixed = extract_prompts.AdaptiveBatchSize(jobs=4, initial=8, minimum=8, maximum=8)
+    fixed.record(8, 10.0)
+    assert fixed.next_size(1000) == 8
+    assert fixed.next_size(3) == 8
+
+    sizer = extract_prompts.AdaptiveBatchSize(jobs=4)
+    sizer.record(10, 0.001)
+    assert sizer.next_size(10_000) == extract_prompts.MAX_BATCH_SIZE
+    assert sizer.next_size(80) == 10  # 80 files over 4 workers x 2 batches
+
+
+def test_batch_size_rejected_with_read_threads(tmp_path):
+    with pytest.raises(ValueError):
+        list(iter_extracted([], jobs=2, read_threads=2, batch_size=4))
+    with pytest.raises(SystemExit):
+        main([str(tmp_path), "--jobs", "2", "--read-threads", "2", "--batch-size", "4"])
+
+
+@pytest.mark.parametrize("jobs, executor", [(1, None), (2, "processes"), (2, "threads")])
+def test_read_threads_pipeline_matches_default(tmp_path, jobs, executor):
+    files = []
+    for i in range(6):
+        graph = json.loads(json.dumps(SAMPLE_API_PROMPT))
+        graph["3"]["inputs"]["text"] = f"prompt {i}"
+        path = tmp_path / f"img_{i}.png"
+        _make_png(path, {"prompt": json.dumps(graph)} if i != 3 else {})
+        files.append((path.name, str(path)))
+    files.append(("missing.png", str(tmp_path / "missing.png")))
+
+    expected = list(iter_extracted(files))
+    stats = ExtractionStats()
+    assert list(iter_extracted(files, jobs=jobs, stats=stats, read_threads=2,
+                               executor=executor)) == expected
+    assert expected[3] == ("img_3.png", None, "no-metadata")
+    assert expected[6][2].startswith("error:FileNotFoundError")
+    assert stats.summary()["files"] == 7
+    assert stats.methods["prompt"] == {"ok": 5}
+    assert stats.times["read"]["count"] == 6
+
+
+def test_thread_executor_shares_caches(tmp_path):
+    files = []
+    for i in range(40):
+        graph = json.loads(json.dumps(SAMPLE_API_PROMPT))
+        graph["3"]["inputs"]["text"] = f"prompt {i // 4}"  # batches of 4 identical images
+        path = tmp_path / f"img_{i:02}.png"
+        _make_png(path, {"prompt": json.dumps(graph)})
+        files.append((path.name, str(path)))
+
+    expected = list(iter_extracted(files))
+    stats = ExtractionStats()
+    order = AdaptiveMethodOrder()
+    results = list(iter_extracted(files, jobs=4, stats=stats, method_order=order,
+                                  executor="threads", batch_size=3))
+    assert results == expected
+    assert stats.methods["prompt"] == {"ok": 40}
+    # One memo for all threads: each distinct chunk is parsed about once.
+    assert stats.counts["memo_hit"] >= 40 - 10 - 4
+    assert order.attempts["prompt"] == 40
+
+
+def test_result_memo_is_thread_safe():
+    memo = extract_prompts.ResultMemo(maxsize=8)
+
+    def work(i):
+        raw = f"chunk {i % 16}"
+        return memo.get_or_compute("prompt", raw, lambda: raw.upper())
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(work, range(2000)))
+    assert results == [f"CHUNK {i % 16}" for i in range(2000)]
+    assert memo.hits + memo.misses == 2000
+    assert len(memo._entries) <= 8
+
+
+def test_adaptive_order_pickles_without_its_lock():
+    import pickle
+    order = AdaptiveMethodOrder()
+    order.record("workflow", False)
+    copy = pickle.loads(pickle.dumps(order))
+    assert copy.order() == ("prompt", "parameters", "workflow")
+    copy.record("prompt", True)
+    assert order.attempts["prompt"] == 0
+
+
+def test_default_executor_follows_the_gil(monkeypatch):
+    monkeypatch.setattr(sys, "_is_gil_enabled", lambda: False, raising=False)
+    assert extract_prompts.default_executor() == "threads"
+    monkeypatch.setattr(sys, "_is_gil_enabled", lambda: True, raising=False)
+    assert extract_prompts.default_executor() == "processes"
+
+
+def test_shared_memory_handoff(tmp_path, monkeypatch):
+    files = []
+    for i in range(8):
+        graph = json.loads(json.dumps(SAMPLE_API_PROMPT))
+        graph["3"]["inputs"]["text"] = f"prompt {i}" + " padding" * (400 * (i % 2))
+        path = tmp_path / f"img_{i}.png"
+        _make_png(path, {"prompt": json.dumps(graph)})
+        files.append((path.name, str(path)))
+    # odd files don't fit a slot and are pickled instead
+    monkeypatch.setattr(extract_prompts, "SHM_SLOT_SIZE", 2048)
+
+    stats = ExtractionStats()
+    results = list(iter_extracted(files, jobs=2, stats=stats, read_threads=2, shared_memory=True))
+    assert results == list(iter_extracted(files))
+    assert results[0] == ("img_0.png", "prompt 0", None)
+    assert (stats.counts["shm_handoff"], stats.counts["shm_pickled"]) == (4, 4)
+
+
+def test_png_text_chunks_from_memoryview_payloads(tmp_path):
+    png = tmp_path / "a.png"
+    _make_png(png, {"workflow": json.dumps(SAMPLE_WORKFLOW), "note": "caf\u00e9"})
+    meta = read_png_text_chunks(str(png))
+    buffer = bytearray()
+    payloads = []
+    for key, ctype, payload in meta.payloads():
+        payloads.append((key, ctype, len(buffer), len(payload)))
+        buffer += payload
+    view = memoryview(bytes(buffer))
+    copy = extract_prompts.PngTextChunks.from_payloads(
+        (key, ctype, view[offset:offset + size]) for key, ctype, offset, size in payloads)
+    assert dict(copy) == dict(meta)
+    assert copy.raw("workflow") == meta.raw("workflow")
+
+
+@pytest.mark.parametrize("jobs, executor, read_threads", [
+    (1, None, 0), (2, "threads", 0), (2, "processes", 0), (1, None, 2), (2, "threads", 2)])
+def test_cached_extraction_streams_lookups(tmp_path, monkeypatch, jobs, executor,
+                                           read_threads):
+    png_dir = tmp_path / "images"
+    png_dir.mkdir()
+    for i in range(60):
+        graph = json.loads(json.dumps(SAMPLE_API_PROMPT))
+        graph["3"]["inputs"]["text"] = f"prompt {i}"
+        _make_png(png_dir / f"img_{i:02}.png", {"prompt": json.dumps(graph)})
+    files = list(scan_png_files(str(png_dir)))
+    cache = extract_prompts.ExtractionCache(str(tmp_path / "cache.sqlite3"))
+    misses = {0, 1, 30, 59}
+    list(extract_prompts.iter_extracted_cached(
+        [f for i, f in enumerate(files) if i not in misses], cache))
+
+    monkeypatch.setattr(extract_prompts, "CACHE_LOOKAHEAD", 8)
+    pools = []
+    extractor_pool = extract_prompts._extractor_pool
+
+    def counting_pool(*args):
+        pools.append(args)
+        return extractor_pool(*args)
+    monkeypatch.setattr(extract_prompts, "_extractor_pool", counting_pool)
+    pulled = []
+
+    def lazily():
+        for f in files:
+            pulled.append(f)
+            yield f
+
+    results, ahead = [], 0
+    for row in extract_prompts.iter_extracted_cached(lazily(), cache, jobs=jobs,
+                                                     executor=executor,
+                                                     read_threads=read_threads):
+        results.append(row)
+        ahead = max(ahead, len(pulled) - len(results))
+    cache.close()
+    assert results == list(iter_extracted(files))
+    assert cache.hits == 56
+    # Rows go out while the folder is still being looked up, and pausing the
+    # lookups keeps the one pool running.
+    assert ahead <= 8
+    assert len(pools) == (1 if jobs > 1 else 0)
+
+
+def test_cli_cache_reuses_unchanged_files(tmp_path):
+    png_dir = tmp_path / "images"
+    png_dir.mkdir()
+    _make_png(png_dir / "a.png", {"workflow": json.dumps(SAMPLE_WORKFLOW)})
+    _make_png(png_dir / "b.png", {"parameters": SAMPLE_PARAMETERS})
+    txt_out = tmp_path / "result.txt"
+    cmd = [sys.executable, str(MODULE_PATH), str(png_dir), str(txt_out)]
+
+    first = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    assert "Reused" not in first.stdout
+    assert (tmp_path / ".extract_prompts_cache.sqlite3").exists()
+
+    second = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    assert "Reused 2 unchanged results" in second.stdout
+    assert txt_out.read_text(encoding="utf-8").splitlines() == [
+        "a beautiful sunset over mountains"] * 2
+
+    # A rewritten file is a cache miss and is extracted again.
+    _make_png(png_dir / "b.png", {"parameters": "a new prompt\nSteps: 20, Sampler: Euler"})
+    third = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    assert "Reused 1 unchanged results" in third.stdout
+    assert txt_out.read_text(encoding="utf-8").splitlines()[1] == "a new prompt"
+
+    fourth = subprocess.run(cmd + ["--rebuild-cache"], check=True, capture_output=True, text=True)
+    assert "Reused" not in fourth.stdout
+
+
+def test_cli_no_cache(tmp_path):
+    png_dir = tmp_path / "images"
+    png_dir.mkdir()
+    _make_png(png_dir / "a.png", {"workflow": json.dumps(SAMPLE_WORKFLOW)})
+    subprocess.run(
+        [sys.executable, str(MODULE_PATH), str(png_dir), str(tmp_path / "out.txt"), "--no-cache"],
+        check=True, capture_output=True, text=True,
+    )
+    assert not (tmp_path / ".extract_prompts_cache.sqlite3").exists()
+
+
+def test_stats_hooks_receive_extraction_events(tmp_path):
+    png_dir = tmp_path / "images"
+    png_dir.mkdir()
+    broken_workflow = {"nodes": [], "links": []}
+    _make_png(png_dir / "a.png", {"workflow": json.dumps(broken_workflow),
+                                  "prompt": json.dumps(SAMPLE_API_PROMPT)})
+    _make_png(png_dir / "b.png", {"parameters": SAMPLE_PARAMETERS})
+
+    events = []
+    stats_path = tmp_path / "stats.json"
+    rc = main([str(png_dir), str(tmp_path / "out.txt"), "--no-cache",
+               "--stats-json", str(stats_path)],
+              hooks=[lambda *event: events.append(event)])
+    assert rc == 0
+    assert ("method", "workflow", "prefiltered:no-saveimage") in events
+    assert ("method", "prompt", "ok") in events
+    assert ("method", "parameters", "ok") in events
+    assert any(kind == "bytes" and name == "read" for kind, name, _ in events)
+
+    summary = json.loads(stats_path.read_text(encoding="utf-8"))
+    assert summary["files"] == 2
+    assert summary["methods"]["workflow"] == {"prefiltered:no-saveimage": 1}
+    assert summary["stages"]["file"]["count"] == 2
+    assert {"read", "json:prompt", "walk:prompt", "parameters"} <= set(summary["stages"])
+
+
+def test_stats_buckets_exception_reasons():
+    stats = ExtractionStats()
+    stats.record("method", "workflow", "error:KeyError: 'id'")
+    stats.record("method", "workflow", "error:KeyError: 'type'")
+    stats.record("time", "read", 0.000003)
+    summary = stats.summary()
+    assert summary["methods"]["workflow"] == {"error:KeyError": 2}
+    assert summary["stages"]["read"]["histogram_us"] == {"<4": 1}
+
+
+def test_cli_multiple_outputs_single_pass(tmp_path):
+    png_dir = tmp_path / "images"
+    png_dir.mkdir()
+    _make_png(png_dir / "a.png", {"workflow": json.dumps(SAMPLE_WORKFLOW)})
+    _make_png(png_dir / "b.png", {"parameters": "caf\u00e9 prompt\nSteps: 20, Sampler: Euler"})
+
+    txt_out, csv_out, jsonl_out = (tmp_path / f"prompts.{ext}" for ext in ("txt", "csv", "jsonl"))
+    proc = subprocess.run(
+        [sys.executable, str(MODULE_PATH), str(png_dir),
+         "--out", str(txt_out), "--out", str(csv_out), "-o", str(jsonl_out)],
+        check=True, capture_output=True, text=True,
+    )
+    assert "Extracted 2 prompts (0 skipped)" in proc.stdout
+    assert txt_out.read_text(encoding="utf-8").splitlines() == [
+        "a beautiful sunset over mountains", "caf\u00e9 prompt"]
+    with open(csv_out, newline="", encoding="utf-8") as f:
+        assert list(csv.reader(f))[1:] == [
+            ["a.png", "a beautiful sunset over mountains"], ["b.png", "caf\u00e9 prompt"]]
+    records = [json.loads(line) for line in jsonl_out.read_text(encoding="utf-8").splitlines()]
+    assert records == [
+        {"filename": "a.png", "prompt": "a beautiful sunset over mountains"},
+        {"filename": "b.png", "prompt": "caf\u00e9 prompt"},
+    ]
+
+
+def _resume_corpus(png_dir):
+    png_dir.mkdir()
+    for i in range(8):
+        graph = json.loads(json.dumps(SAMPLE_API_PROMPT))
+        graph["3"]["inputs"]["text"] = f"prompt {i}"
+        _make_png(png_dir / f"img_{i}.png", {"prompt": json.dumps(graph)} if i != 2 else {})
+
+
+def _interrupt_after(files):
+    seen = []
+
+    def hook(kind, name, value):
+        if (kind, name) == ("time", "file"):
+            seen.append(value)
+            if len(seen) > files:
+                raise KeyboardInterrupt
+    return hook
+
+
+def test_resume_continues_interrupted_run(tmp_path, monkeypatch, capsys):
+    png_dir = tmp_path / "images"
+    _resume_corpus(png_dir)
+    ref_txt, ref_csv = tmp_path / "ref.txt", tmp_path / "ref.csv"
+    assert main([str(png_dir), str(ref_txt), "--out", str(ref_csv), "--no-cache"]) == 0
+
+    monkeypatch.setattr(extract_prompts, "CHECKPOINT_INTERVAL", 0.0)
+    out_txt, out_csv = tmp_path / "out.txt", tmp_path / "out.csv"
+    argv = [str(png_dir), str(out_txt), "--out", str(out_csv), "--no-cache"]
+    with pytest.raises(KeyboardInterrupt):
+        main(argv, hooks=[_interrupt_after(5)])
+    checkpoint = json.loads((tmp_path / "out.txt.checkpoint").read_text(encoding="utf-8"))
+    assert (checkpoint["files"], checkpoint["last"]) == (5, "img_4.png")
+    assert (checkpoint["extracted"], checkpoint["skipped"]) == (4, 1)
+    assert not out_txt.exists()
+
+    # Rows written after the checkpoint are cut off on resume.
+    with open(str(out_csv) + ".part", "a", encoding="utf-8") as f:
+        f.write("img_5.png,half a ro")
+
+    capsys.readouterr()
+    assert main(argv + ["--resume"]) == 0
+    assert "Extracted 7 prompts (1 skipped)" in capsys.readouterr().out
+    assert out_txt.read_bytes() == ref_txt.read_bytes()
+    assert out_csv.read_bytes() == ref_csv.read_bytes()
+    assert not (tmp_path / "out.txt.checkpoint").exists()
+
+
+def test_resume_refuses_a_different_run(tmp_path, monkeypatch):
+    png_dir = tmp_path / "images"
+    _resume_corpus(png_dir)
+    monkeypatch.setattr(extract_prompts, "CHECKPOINT_INTERVAL", 0.0)
+    argv = [str(png_dir), str(tmp_path / "out.txt"), "--no-cache"]
+    with pytest.raises(KeyboardInterrupt):
+        main(argv, hooks=[_interrupt_after(3)])
+
+    with pytest.raises(SystemExit):
+        main(argv + ["--resume", "--all-outputs"])
+    # The last checkpointed file is gone: the rest of the order is unknown.
+    (png_dir / "img_2.png").unlink()
+    assert main(argv + ["--resume"]) == 1
+    assert (tmp_path / "out.txt.checkpoint").exists()
+
+
+def test_fresh_run_drops_a_stale_checkpoint(tmp_path, monkeypatch, capsys):
+    png_dir = tmp_path / "images"
+    _resume_corpus(png_dir)
+    ref_txt = tmp_path / "ref.txt"
+    assert main([str(png_dir), str(ref_txt), "--no-cache"]) == 0
+    out_txt = tmp_path / "out.txt"
+    argv = [str(png_dir), str(out_txt), "--no-cache"]
+    monkeypatch.setattr(extract_prompts, "CHECKPOINT_INTERVAL", 0.0)
+    with pytest.raises(KeyboardInterrupt):
+        main(argv, hooks=[_interrupt_after(5)])
+
+    # A fresh run that dies before its own first checkpoint...
+    monkeypatch.setattr(extract_prompts, "CHECKPOINT_INTERVAL", 3600.0)
+    with pytest.raises(KeyboardInterrupt):
+        main(argv, hooks=[_interrupt_after(1)])
+    assert not (tmp_path / "out.txt.checkpoint").exists()
+    # ...leaves nothing for --resume to pick up but a start from scratch.
+    capsys.readouterr()
+    assert main(argv + ["--resume"]) == 0
+    assert "No checkpoint" in capsys.readouterr().out
+    assert out_txt.read_bytes() == ref_txt.read_bytes()
+
+
+def test_resume_refuses_a_shortened_part_file(tmp_path, monkeypatch):
+    png_dir = tmp_path / "images"
+    _resume_corpus(png_dir)
+    out_txt = tmp_path / "out.txt"
+    argv = [str(png_dir), str(out_txt), "--no-cache"]
+    monkeypatch.setattr(extract_prompts, "CHECKPOINT_INTERVAL", 0.0)
+    with pytest.raises(KeyboardInterrupt):
+        main(argv, hooks=[_interrupt_after(5)])
+    (tmp_path / "out.txt.part").write_text("", encoding="utf-8")
+    assert main(argv + ["--resume"]) == 1
+    assert (tmp_path / "out.txt.part").read_bytes() == b""
+
+
+def test_resume_does_not_swallow_other_errors(tmp_path, monkeypatch):
+    png_dir = tmp_path / "images"
+    _resume_corpus(png_dir)
+    monkeypatch.setattr(extract_prompts, "CHECKPOINT_INTERVAL", 0.0)
+    argv = [str(png_dir), str(tmp_path / "out.txt"), "--no-cache"]
+    with pytest.raises(KeyboardInterrupt):
+        main(argv, hooks=[_interrupt_after(3)])
+
+    def broken_hook(kind, name, value):
+        raise ValueError("hook failed")
+    with pytest.raises(ValueError, match="hook failed"):
+        main(argv + ["--resume"], hooks=[broken_hook])